@@ -0,0 +1,55 @@
+'''
+Title: bench_compiled
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file benchmarks the compiled backend of the Simulation against the python backend for closed-loop runs of 10^6 to 10^8
+            steps. Traces are decimated (1 sample every 1000 steps) to keep the memory bounded. The python backend is only timed up to
+            --python-max-steps, its throughput is extrapolated for longer runs.
+            Run from the root folder with: python benchmarks/bench_compiled.py
+'''
+import sys, os
+import argparse
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+from modules.simulation import Simulation
+from modules.kernels import NUMBA_AVAILABLE
+
+def time_run(backend, n_steps, decimation=1000):
+    """Wall time of a closed-loop run of n_steps steps [s]"""
+    dt = 100 / n_steps
+    simEnv = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12*dt, kd=0.05, Ts=dt),
+                        target_velocity=5, dt=dt, sim_time=100, decimation=decimation, backend=backend)
+    start = time.perf_counter()
+    simEnv.run()
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compiled backend benchmark')
+    parser.add_argument('--steps', type=float, nargs='*', default=[1e6, 1e7, 1e8], help='Run lengths in steps')
+    parser.add_argument('--python-max-steps', type=float, default=1e6, help='Longest run timed with the python backend')
+    args = parser.parse_args(argv)
+
+    print(f'Numba available: {NUMBA_AVAILABLE}')
+    time_run('compiled', 1000)    # JIT compilation (or cache load) is not included in the timings
+    python_rate = None
+    print(f'{"steps":>12} {"python [s]":>12} {"compiled [s]":>13} {"speedup":>8}')
+    for n_steps in [int(n) for n in args.steps]:
+        if n_steps <= args.python_max_steps:
+            t_python = time_run('python', n_steps)
+            python_rate = n_steps / t_python
+            python_label = f'{t_python:>12.3f}'
+        elif python_rate is not None:
+            t_python = n_steps / python_rate
+            python_label = f'{"~" + format(t_python, ".1f"):>12}'    # Extrapolated
+        else:
+            t_python, python_label = None, f'{"-":>12}'
+        t_compiled = time_run('compiled', n_steps)
+        speedup = f'{t_python / t_compiled:>7.1f}x' if t_python else f'{"-":>8}'
+        print(f'{n_steps:>12} {python_label} {t_compiled:>13.3f} {speedup}')
+
+if __name__=="__main__":
+    main()
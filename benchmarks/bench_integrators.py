@@ -0,0 +1,44 @@
+'''
+Title: bench_integrators
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file benchmarks the accuracy of the plant integrators against their cost (plant evaluations and wall time) for a
+            closed-loop run with a high initial velocity. The controller is sampled every TS in all cases.
+            Run from the root folder with: python benchmarks/bench_integrators.py
+'''
+import sys, os
+import time
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+from modules.simulation import Simulation
+from modules.integrators import Euler_Integrator, RK4_Integrator, RK45_Integrator
+
+TS = 1                  # Controller sampling time [s]
+SIM_TIME = 50           # Simulated time [s]
+INITIAL_VELOCITY = 25   # Initial speed [m/s]
+
+def simulate(integrator):
+    """Runs the closed-loop scenario and returns the velocity trace, the plant evaluations and the wall time"""
+    simEnv = Simulation(vehicle=Vehicle(mass=1, initial_velocity=INITIAL_VELOCITY, k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=TS),
+                        target_velocity=5, dt=TS, sim_time=SIM_TIME, integrator=integrator)
+    start = time.perf_counter()
+    simEnv.run()
+    return simEnv.velocity, integrator.n_evaluations, time.perf_counter() - start
+
+def main():
+    reference, _, _ = simulate(RK45_Integrator(rtol=1e-13, atol=1e-13))
+    cases = [(f'Euler x{n}', Euler_Integrator(substeps=n)) for n in [1, 10, 100, 1000, 10000]]
+    cases += [(f'RK4 x{n}', RK4_Integrator(substeps=n)) for n in [1, 2, 4, 8, 16]]
+    cases += [(f'RK45 rtol={rtol:.0e}', RK45_Integrator(rtol=rtol, atol=rtol)) for rtol in [1e-3, 1e-5, 1e-7, 1e-9]]
+    print(f'{"integrator":>16} {"max error [m/s]":>16} {"plant evals":>12} {"wall time [s]":>14}')
+    for name, integrator in cases:
+        velocity, n_evaluations, wall_time = simulate(integrator)
+        error = np.max(np.abs(velocity - reference))
+        print(f'{name:>16} {error:>16.3e} {n_evaluations:>12} {wall_time:>14.4f}')
+
+if __name__=="__main__":
+    main()
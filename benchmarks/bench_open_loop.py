@@ -0,0 +1,37 @@
+'''
+Title: bench_open_loop
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file benchmarks the open-loop (No_Controller) fast path of the Simulation against the step-by-step loop.
+            Run from the root folder with: python benchmarks/bench_open_loop.py
+'''
+import sys, os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.vehicle import Vehicle
+from modules.controller import No_Controller
+from modules.simulation import Simulation
+
+def time_run(open_loop, dt, sim_time=50, repeat=3):
+    """Best wall time of a few open-loop runs [s]"""
+    best = float('inf')
+    for _ in range(repeat):
+        simEnv = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=dt, sim_time=sim_time, open_loop=open_loop)
+        start = time.perf_counter()
+        simEnv.run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    print(f'{"steps":>10} {"step loop [s]":>14} {"euler [s]":>10} {"speedup":>8} {"exact [s]":>10} {"speedup":>8}')
+    for dt in [1e-1, 1e-2, 1e-3, 1e-4]:
+        steps = round(50 / dt)
+        t_loop = time_run(None, dt, repeat=1 if steps > 10**5 else 3)
+        t_euler = time_run('euler', dt)
+        t_exact = time_run('exact', dt)
+        print(f'{steps:>10} {t_loop:>14.4f} {t_euler:>10.4f} {t_loop/t_euler:>7.1f}x {t_exact:>10.4f} {t_loop/t_exact:>7.1f}x')
+
+if __name__=="__main__":
+    main()
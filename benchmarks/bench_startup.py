@@ -0,0 +1,71 @@
+'''
+Title: bench_startup
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file benchmarks the startup latency of the package: the cold import time of its modules and the latency of the first
+            simulation run, each one measured in a fresh interpreter (as in a new worker process or command line run). It also reports
+            whether matplotlib and Numba were loaded, which only the plotting and the compiled backend should do.
+            Run from the root folder with: python benchmarks/bench_startup.py
+'''
+import sys, os
+import argparse
+import json
+import subprocess
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MODULES = ('modules.vehicle', 'modules.controller', 'modules.simulation', 'modules.batch_simulation', 'modules.sweep', 'modules.scenarios',
+           'modules.plotting')
+
+FIRST_RUN = {
+    'python': "Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), "
+              "target_velocity=5, dt=1, sim_time=50).run()",
+    'compiled': "Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), "
+                "target_velocity=5, dt=1, sim_time=50, backend='compiled').run()",
+}
+
+# Code run in the fresh interpreter: times the import and the statement, and reports the heavy modules that were loaded
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+{statement}
+finished = time.perf_counter()
+print(json.dumps({{'import':imported - start, 'run':finished - imported,
+                  'matplotlib':'matplotlib' in sys.modules, 'numba':'numba' in sys.modules}}))
+'''
+
+def probe(imports:str, statement:str='pass') -> dict:
+    """Runs the probe in a fresh interpreter and returns its timings [s]"""
+    code = PROBE.format(imports=imports, statement=statement)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def median_probe(imports:str, statement:str='pass', repeat:int=5) -> dict:
+    """Median timings over several fresh interpreters"""
+    results = [probe(imports, statement) for _ in range(repeat)]
+    return {'import':float(np.median([r['import'] for r in results])), 'run':float(np.median([r['run'] for r in results])),
+            'matplotlib':results[0]['matplotlib'], 'numba':results[0]['numba']}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Startup latency benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per measurement (the median is reported)')
+    args = parser.parse_args(argv)
+
+    print(f'{"cold import":<28} {"time [ms]":>10} {"matplotlib":>11} {"numba":>6}')
+    for module in MODULES:
+        result = median_probe(f'import {module}', repeat=args.repeat)
+        print(f'{module:<28} {result["import"] * 1e3:>10.1f} {str(result["matplotlib"]):>11} {str(result["numba"]):>6}')
+
+    print(f'\n{"first run":<28} {"import [ms]":>11} {"run [ms]":>9} {"total [ms]":>11} {"matplotlib":>11} {"numba":>6}')
+    imports = 'from modules.vehicle import Vehicle\nfrom modules.controller import PID_Discrete_Controller\nfrom modules.simulation import Simulation'
+    for backend, statement in FIRST_RUN.items():
+        result = median_probe(imports, statement, repeat=args.repeat)
+        total = result['import'] + result['run']
+        print(f'{backend:<28} {result["import"] * 1e3:>11.1f} {result["run"] * 1e3:>9.1f} {total * 1e3:>11.1f} {str(result["matplotlib"]):>11} {str(result["numba"]):>6}')
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,172 @@
+'''
+Title: run_benchmarks
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the benchmark suite and the performance regression harness. Every case records the wall time, the steps
+            per second and the peak memory (Python allocations traced with tracemalloc, parent process only) to a JSON file.
+            When a baseline file is given, the run fails (exit code 1) if a case is slower or uses more memory than the baseline by more
+            than the threshold.
+            Run from the root folder with:
+                python benchmarks/run_benchmarks.py --save benchmarks/baseline.json                 # Record a baseline
+                python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2   # Check for regressions
+'''
+import sys, os
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+from modules.simulation import Simulation
+from modules.batch_simulation import Batch_Simulation
+from modules.sweep import make_grid, run_sweep
+
+######### Benchmark cases #########
+# Every case returns a function that runs the workload once and returns the number of simulation steps it performed.
+
+def case_vehicle_update(n=200_000):
+    def run():
+        myVehicle = Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05)
+        for _ in range(n):
+            myVehicle.velocity = myVehicle.update(force=0.1, dt=0.01)
+        return n
+    return run
+
+def case_pid_update(n=200_000):
+    def run():
+        myController = PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1)
+        for _ in range(n):
+            myController.update(0.5)
+        return n
+    return run
+
+def case_long_run(sim_time=100, dt=1e-3):
+    def run():
+        simEnv = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=dt),
+                            target_velocity=5, dt=dt, sim_time=sim_time)
+        simEnv.run()
+        return simEnv.n_steps
+    return run
+
+def case_open_loop_run(sim_time=100, dt=1e-3):
+    def run():
+        simEnv = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=dt, sim_time=sim_time)
+        simEnv.run()
+        return simEnv.n_steps
+    return run
+
+def case_robustness_sweep(processes=1):
+    def run():
+        grid = make_grid(initial_velocity=np.arange(start=-50, stop=50, step=5))  # Same sweep as main.main()
+        run_sweep(grid, Ts=1, dt=1, sim_time=50, error_thr=1, processes=processes)
+        return len(grid) * 50
+    return run
+
+def case_grid_sweep(n_velocities=50, n_gains=10, processes=None):
+    def run():
+        grid = make_grid(initial_velocity=np.linspace(-30, 30, n_velocities), kp=np.linspace(0.1, 0.5, n_gains), ki=np.linspace(0.05, 0.2, n_gains))
+        run_sweep(grid, Ts=1, dt=1, sim_time=50, error_thr=1, processes=processes)
+        return len(grid) * 50
+    return run
+
+def case_grid_batch(n_velocities=50, n_gains=10):
+    def run():
+        grid = make_grid(initial_velocity=np.linspace(-30, 30, n_velocities), kp=np.linspace(0.1, 0.5, n_gains), ki=np.linspace(0.05, 0.2, n_gains))
+        myBatch = Batch_Simulation(mass=grid['mass'], initial_velocity=grid['initial_velocity'], k_kgpm=grid['k_kgpm'], kp=grid['kp'], ki=grid['ki'],
+                                   kd=grid['kd'], Ts=1, target_velocity=grid['target_velocity'], dt=1, sim_time=50, error_thr=1)
+        myBatch.run().get_settling_time()
+        return len(grid) * 50
+    return run
+
+def get_cases(quick=False):
+    """Benchmark cases by name. The quick variants are meant for smoke tests"""
+    scale = 10 if quick else 1
+    cases = {
+        'vehicle_update': case_vehicle_update(n=200_000 // scale),
+        'pid_update': case_pid_update(n=200_000 // scale),
+        'long_run_1e4_steps': case_long_run(dt=1e-2),
+        'open_loop_run_1e5_steps': case_open_loop_run(dt=1e-3),
+        'robustness_sweep_serial': case_robustness_sweep(processes=1),
+        'robustness_sweep_parallel': case_robustness_sweep(processes=None),
+        'grid_sweep_parallel': case_grid_sweep(n_velocities=50 // scale),
+        'grid_batch': case_grid_batch(n_velocities=50 // scale),
+    }
+    if not quick:
+        cases['long_run_1e5_steps'] = case_long_run(dt=1e-3)
+    return cases
+
+######### Harness #########
+
+def measure(run, repeat:int=3) -> dict:
+    """Best wall time over repeat runs, and the peak traced memory of an extra run"""
+    run()   # Warm-up (imports, caches, process pools)
+    wall_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        steps = run()
+        wall_time = min(wall_time, time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'wall_time':wall_time, 'steps':steps, 'steps_per_second':steps / wall_time, 'peak_memory':peak_memory}
+
+def compare(results:dict, baseline:dict, threshold:float) -> list:
+    """Returns the list of regressions: cases whose throughput dropped or whose peak memory grew by more than the threshold"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        if result['steps_per_second'] < reference['steps_per_second'] * (1 - threshold):
+            regressions.append(f'{name}: {result["steps_per_second"]:.4g} steps/s vs {reference["steps_per_second"]:.4g} steps/s in the baseline')
+        if result['peak_memory'] > reference['peak_memory'] * (1 + threshold):
+            regressions.append(f'{name}: {result["peak_memory"]} B peak memory vs {reference["peak_memory"]} B in the baseline')
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vehicle Control Problem benchmark suite')
+    parser.add_argument('--cases', nargs='*', help='Cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions per case, the best one is kept')
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads, for smoke tests')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative regression (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    cases = get_cases(quick=args.quick)
+    names = args.cases or list(cases)
+    unknown = set(names) - set(cases)
+    if unknown:
+        parser.error(f'Unknown cases: {sorted(unknown)}. Available: {list(cases)}')
+
+    results = {}
+    print(f'{"case":>28} {"wall time [s]":>14} {"steps/s":>12} {"peak memory [kB]":>17}')
+    for name in names:
+        results[name] = measure(cases[name], repeat=args.repeat)
+        print(f'{name:>28} {results[name]["wall_time"]:>14.4f} {results[name]["steps_per_second"]:>12.4g} {results[name]["peak_memory"]/1024:>17.1f}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'machine':{'platform':platform.platform(), 'python':platform.python_version(), 'numpy':np.__version__, 'cpu_count':os.cpu_count()},
+                       'quick':args.quick, 'results':results}, f, indent=2)
+        print(f'Results saved in {args.save}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print(f'No regressions beyond {args.threshold:.0%} with respect to {args.baseline}')
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -8,15 +8,20 @@ Description: This file sets up the scenario to simulate the motion of a 1D vehic
 
 from modules.vehicle import Vehicle
 from modules.simulation import Simulation
-from modules.controller import *
+from modules.tuning import PID_Tuner
+from modules.plotting import make_job, render_sweep
+from modules.controller import PID_Discrete_Controller, No_Controller
 
 import matplotlib.pyplot as plt
+import argparse
 import logging
 import numpy as np
 
-def main():
+def main(headless=False):
     ######### Setup logger #########
     logging.basicConfig(level=logging.INFO)
+    if headless:
+        plt.switch_backend('Agg')   # Non-interactive backend: figures are only saved, no window is opened
 
     ######### Definition of constants #########
     MASS = 1                # vehicle mass [kg]
@@ -26,7 +31,7 @@ def main():
     K_KGPM = 0.05           # Force constant [kg/m]
     SIM_TIME = 50           # Simulated time for plotting purposes [s]
     CONTROLLER_MODE = "PI"  # or "PID" 
-    COEFFICIENTS_CALC = None # or "ZIEGLER" to calculate coefficients according to Ziegler-Nicholson.
+    COEFFICIENTS_CALC = None # or "ZIEGLER" to calculate coefficients according to Ziegler-Nicholson, or "AUTO" to tune them automatically.
     logging.info(f'Constants: MASS:{MASS}kg, INITIAL_VELOCITY:{INITIAL_VELOCITY}m/s, TARGET_VELOCITY:{TARGET_VELOCITY}m/s, ERROR_BAND:{ERROR_BAND}%, K_KGMP:{K_KGPM}kg/m, SIM_TIME:{SIM_TIME}s')
     
     ######### Output paths setup #########
@@ -50,6 +55,11 @@ def main():
             KP = 0.6*KU
             KI = 1.2*KU/TU
             KD = 0.075*KU*TU
+    elif COEFFICIENTS_CALC == "AUTO":                   # Used to find Ku, Tu and refine the PID parameters automatically
+        velocity_control_path = f'output/velocity_profile_{CONTROLLER_MODE}_AUTO.png'
+        tuned = PID_Tuner(mass=MASS, initial_velocity=INITIAL_VELOCITY, k_kgpm=K_KGPM, target_velocity=TARGET_VELOCITY, Ts=TS, sim_time=SIM_TIME, error_thr=ERROR_BAND).tune(mode=CONTROLLER_MODE)
+        logging.info(f'Tuning results: Ku:{round(tuned["ku"],4)}, Tu:{round(tuned["tu"],4)}s, cost:{round(tuned["cost"],4)}')
+        KP, KI, KD = tuned['kp'], tuned['ki'], tuned['kd']
     else: # Used to manually input PID parameters
         velocity_control_path = 'output/velocity_profile.png'
         KP = 0.28
@@ -74,8 +84,9 @@ def main():
     plt.figure(2)
     plt.title('Vehicle velocity error without controller')
     logging.info(f'Velocity profile plot without controller saved in {velocity_no_control_path}')
-    logging.info(f'Close figures to continue')
-    plt.show()
+    if not headless:
+        logging.info(f'Close figures to continue')
+        plt.show()
     
     ######### Simulation of Vehicle with controller #########
     logging.info('Initializing vehicle with controller')                            
@@ -99,23 +110,26 @@ def main():
     plt.ylim((-2,2))
     plt.savefig(error_plot_zoom_path)
     logging.info(f'Error profile plot saved in {error_plot_path}')
-    logging.info(f'Close figures to continue')
-    plt.show()
+    if not headless:
+        logging.info(f'Close figures to continue')
+        plt.show()
 
     ######### Robustness with respect to the initial velocity #########
     logging.info(f'Starting robustness analysis...')
     velocity_vec = []
     settling_time = []
+    report_jobs = []
     for v0 in np.arange(start=-50, stop=50, step=5):
-        myPIDController.reset()                                             # Resets PID parameters
         myRover3 = Vehicle(mass=MASS, initial_velocity=v0,k_kgpm=K_KGPM)    # Initialization of the Vehicle object without controller
-        simEnv = Simulation(vehicle=myRover3,controller=myPIDController,target_velocity=TARGET_VELOCITY,dt=TS, sim_time=SIM_TIME,error_thr=ERROR_BAND)                   # Simulation environment setup adding the Vehicle object
+        myPIDController3 = PID_Discrete_Controller(kp=KP, ki=KI, kd=KD, Ts=TS) # Fresh controller for every run, no state is shared between runs
+        simEnv = Simulation(vehicle=myRover3,controller=myPIDController3,target_velocity=TARGET_VELOCITY,dt=TS, sim_time=SIM_TIME,error_thr=ERROR_BAND)                   # Simulation environment setup adding the Vehicle object
         simEnv.run()
         ts = simEnv.get_settling_time()
         if ts != -1:
             simEnv.plot_velocity(label=f'V_0: {v0}m/s - ts: {ts}s')    
         velocity_vec.append(v0)
         settling_time.append(ts)
+        report_jobs.append(make_job(simEnv, name=f'robustness_v0_{v0}'))
     plt.legend(loc='right')
     plt.title('Robustness analysis with respect to the initial velocity')
     plt.savefig('output/response_sensitivity.png')
@@ -129,9 +143,15 @@ def main():
     plt.ylim((0,30))
     plt.grid(visible=True)
     plt.savefig('output/settling_time.png')
-    plt.show()
+    if headless:
+        paths = render_sweep(report_jobs, output_dir='output/robustness')     # Individual reports of every run, rendered in a worker pool
+        logging.info(f'{len(paths)} robustness reports saved in output/robustness')
+    else:
+        plt.show()
 
     logging.info(f'Execution finished!')
 
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Vehicle Control Problem')
+    parser.add_argument('--headless', action='store_true', help='Save all the figures without opening any window')
+    main(headless=parser.parse_args().headless)
\ No newline at end of file
@@ -0,0 +1,135 @@
+'''
+Title: batch_simulation
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Batch_Simulation class definition which advances N vehicles, each one with its own discrete PID controller,
+            in lockstep. Masses, drag constants, velocities and controller states are stored in NumPy arrays so that every time step is a
+            single vectorized operation instead of N calls to Vehicle.update and PID_Discrete_Controller.update.
+'''
+import numpy as np
+from modules.controller import Controller, PID_Controller_Bank
+from modules.metrics import compute_metrics
+from modules.trace import get_n_steps
+
+class Batch_Simulation:
+    """Vectorized equivalent of running N independent Simulation objects with a Vehicle and a PID controller"""
+    def __init__(self, mass, initial_velocity, k_kgpm, kp=0, ki=0, kd=0, Ts=1, target_velocity=5, dt:float=1, sim_time:float=100, error_thr:float=1,
+                 force_limit=np.inf, disturbance_force=0, sensor_noise_std=0, rng:np.random.Generator=None, controller:Controller=None):
+        """Definition of the Batch_Simulation attributes. Every vehicle/controller parameter may be a scalar or an array, they are broadcast to a common length N.
+        kp, ki, kd and Ts follow the PID_Discrete_Controller convention (the integral is not multiplied by Ts) and define a PID_Controller_Bank
+        saturated at +-force_limit [N]. Alternatively, any Controller working on arrays of N errors (e.g. a PID_Controller_Bank with anti-windup)
+        can be given as controller, the gains and force_limit are then ignored.
+        Optional non-idealities: a constant external force disturbance_force [N] and gaussian sensor noise with standard deviation
+        sensor_noise_std [m/s] on the velocity measured by the controllers (drawn from rng)"""
+        # Data validation
+        if dt <= 0 or not isinstance(dt,(int,float)):
+            raise ValueError('dt must be a positive float.')
+        if sim_time <= 0 or not isinstance(sim_time,(int,float)):
+            raise ValueError('sim_time must be a positive float.')
+
+        (self.mass, self.initial_velocity, self.k_kgpm, self.kp, self.ki, self.kd,
+         self.Ts, self.target_velocity, self.force_limit, self.disturbance_force, self.sensor_noise_std) = (
+            np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in
+            np.broadcast_arrays(mass, initial_velocity, k_kgpm, kp, ki, kd, Ts, target_velocity, force_limit, disturbance_force, sensor_noise_std))
+        if np.any(self.mass <= 0):
+            raise ValueError("Mass must be positive.")
+        if np.any(self.k_kgpm < 0):
+            raise ValueError("k_kgpm cannot be negative.")
+        if np.any(self.Ts <= 0):
+            raise ValueError('Ts must be positive.')
+        if np.any(self.force_limit <= 0):
+            raise ValueError('force_limit must be positive.')
+        if np.any(self.sensor_noise_std < 0):
+            raise ValueError('sensor_noise_std cannot be negative.')
+
+        self.n = self.mass.size         # Number of vehicles simulated in lockstep
+        self.dt = dt                    # Simulation time step [s]
+        self.sim_time = sim_time        # Simulation duration [s]
+        self.error_thr = error_thr      # Error threshold [%]
+        self.rng = rng if rng is not None else np.random.default_rng()  # Random generator of the sensor noise
+        if controller is None:
+            controller = PID_Controller_Bank(kp=self.kp, ki=self.ki / self.Ts, kd=self.kd, Ts=self.Ts, u_min=-self.force_limit, u_max=self.force_limit)
+        elif not isinstance(controller, Controller):
+            raise TypeError('\'controller\' must be an object of class \'Controller\'')
+        elif getattr(controller, 'n', self.n) != self.n:
+            raise ValueError(f'The controller bank has {controller.n} controllers but there are {self.n} vehicles.')
+        self.controller = controller    # Controllers of all the vehicles, evaluated in one vectorized call per step
+
+        self.time = None                # Time vector, shape (steps,)
+        self.velocity = None            # Velocity traces, shape (N, steps)
+        self.error = None               # Velocity error traces [%], shape (N, steps)
+        self.force = None               # Controller output traces, shape (N, steps)
+
+    @classmethod
+    def from_simulations(cls, simulations):
+        """Builds a batch from a list of Simulation objects sharing dt, sim_time and error_thr. Their controllers must be PID_Discrete_Controller or No_Controller"""
+        from modules.controller import PID_Discrete_Controller, No_Controller
+        if len(simulations) == 0:
+            raise ValueError('At least one simulation is required.')
+        first = simulations[0]
+        params = {'mass':[], 'initial_velocity':[], 'k_kgpm':[], 'kp':[], 'ki':[], 'kd':[], 'Ts':[], 'target_velocity':[]}
+        for sim in simulations:
+            if (sim.dt, sim.sim_time, sim.error_thr) != (first.dt, first.sim_time, first.error_thr):
+                raise ValueError('All simulations must share dt, sim_time and error_thr.')
+            if isinstance(sim.controller, PID_Discrete_Controller):
+                gains = (sim.controller.kp, sim.controller.ki, sim.controller.kd, sim.controller.Ts)
+            elif isinstance(sim.controller, No_Controller):
+                gains = (0, 0, 0, sim.dt)
+            else:
+                raise TypeError('Only PID_Discrete_Controller and No_Controller can be batched.')
+            for key, value in zip(('kp', 'ki', 'kd', 'Ts'), gains):
+                params[key].append(value)
+            params['mass'].append(sim.vehicle.mass)
+            params['initial_velocity'].append(sim.vehicle.velocity)
+            params['k_kgpm'].append(sim.vehicle.k_kgpm)
+            params['target_velocity'].append(sim.target_velocity)
+        return cls(**params, dt=first.dt, sim_time=first.sim_time, error_thr=first.error_thr)
+
+    def get_n_steps(self):
+        """Number of samples produced by a run"""
+        return get_n_steps(self.sim_time, self.dt)
+
+    def run(self):
+        """Vectorized loop that advances all vehicles and controllers one time step at a time"""
+        n_steps = self.get_n_steps()
+        self.time = np.arange(n_steps) * self.dt
+        self.velocity = np.empty((self.n, n_steps))
+        self.error = np.empty((self.n, n_steps))
+        self.force = np.empty((self.n, n_steps))
+
+        mass, k_kgpm, target = self.mass, self.k_kgpm, self.target_velocity
+        controller = self.controller
+        if hasattr(controller, 'reset'):
+            controller.reset()
+        disturbed = np.any(self.disturbance_force != 0)
+        noisy = np.any(self.sensor_noise_std > 0)
+        velocity = self.initial_velocity.copy()     # Current velocities [m/s]
+        with np.errstate(over='ignore', invalid='ignore'):  # Unstable vehicles are allowed to diverge to inf/nan as in Simulation
+            for k in range(n_steps):
+                self.velocity[:, k] = velocity
+                error = target - velocity                                       # Absolute error
+                if noisy:                                                       # Error seen by the controllers
+                    error = error - self.sensor_noise_std * self.rng.standard_normal(self.n)
+                Fc = controller.update(error)                                   # Controllers' output Fc
+                self.force[:, k] = Fc
+                self.error[:, k] = (target - velocity) / target * 100           # True error calculated as percentage
+                drag = -np.sign(velocity) * k_kgpm * velocity ** 2              # Quadratic drag force
+                if disturbed:
+                    Fc = Fc + self.disturbance_force
+                velocity = velocity + (Fc + drag) / mass * self.dt              # Explicit Euler step
+        return self
+
+    def get_settling_time(self):
+        """Settling time of every vehicle, -1 for the vehicles that did not settle (same criterion as Simulation.get_settling_time)"""
+        outside = self.error > self.error_thr                                   # Elements outside the threshold
+        any_outside = outside.any(axis=1)
+        last_outside = outside.shape[1] - 1 - np.argmax(outside[:, ::-1], axis=1)
+        last_error = self.error[:, -1]
+        settled = any_outside & ~(last_error > self.error_thr) & ~np.isnan(last_error)
+        return np.where(settled, self.time[last_outside], -1)
+
+    def get_metrics(self, divergence_velocity:float=None, **kwargs) -> np.ndarray:
+        """Response metrics of every vehicle (see modules.metrics.compute_metrics), with the two-sided error band"""
+        return compute_metrics(self.time, self.error, self.force, error_thr=self.error_thr, velocity=self.velocity,
+                               divergence_velocity=divergence_velocity, **kwargs)
@@ -6,8 +6,10 @@ Scope: Vehicle Control Problem
 Description: This file contains the definitions of the controller abstract class and the controllers used:
     - PID_Discrete_Controller
     - No_Controller
+    - PID_Controller_Bank
 '''
 from abc import ABC, abstractmethod
+import numpy as np
 
 class Controller(ABC):
     """Parent class to define a template and a clear interface with controllers"""
@@ -53,4 +55,70 @@ class No_Controller(Controller):
 
     def update(self, error):
         """Updates the controller output as always 0"""
-        return 0
\ No newline at end of file
+        return 0
+
+class PID_Controller_Bank(Controller):
+    """Bank of N discrete PID controllers evaluated at once on NumPy arrays, each one with its own gains, output saturation,
+    anti-windup and derivative filter. The integral is accumulated as sum(error*Ts), so with Ts=1 and no saturation or filter
+    every instance behaves exactly as a PID_Discrete_Controller"""
+    def __init__(self, kp, ki, kd, Ts, u_min=-np.inf, u_max=np.inf, anti_windup:str=None, kt=1.0, derivative_tau=0.0) -> None:
+        """Every parameter may be a scalar or an array, they are broadcast to a common length N.
+            - u_min, u_max: output saturation limits
+            - anti_windup: None, 'clamping' (the integral is frozen while the output saturates in the direction of the error) or
+              'back_calculation' (the integral is corrected with kt times the difference between saturated and unsaturated outputs)
+            - derivative_tau: time constant of the first order low-pass filter of the derivative component [s], 0 for no filter"""
+        if anti_windup not in (None, 'clamping', 'back_calculation'):
+            raise ValueError('anti_windup must be None, \'clamping\' or \'back_calculation\'.')
+        (self.kp, self.ki, self.kd, self.Ts, self.u_min, self.u_max, self.kt, self.derivative_tau) = (
+            np.atleast_1d(np.asarray(x, dtype=np.float64)).copy() for x in np.broadcast_arrays(kp, ki, kd, Ts, u_min, u_max, kt, derivative_tau))
+        if np.any(self.Ts <= 0):
+            raise ValueError('Ts must be positive.')
+        if np.any(self.u_min >= self.u_max):
+            raise ValueError('u_min must be lower than u_max.')
+        if np.any(self.derivative_tau < 0):
+            raise ValueError('derivative_tau cannot be negative.')
+        self.n = self.kp.size                                                   # Number of controllers
+        self.anti_windup = anti_windup                                          # Anti-windup method
+        self.saturated = bool(np.any(np.isfinite(self.u_min)) or np.any(np.isfinite(self.u_max)))
+        self.filtered = bool(np.any(self.derivative_tau > 0))
+        self.alpha = self.derivative_tau / (self.derivative_tau + self.Ts)      # Derivative filter coefficient
+        self.reset()
+
+    def update(self, error):
+        """Updates the output of every controller given their errors (array of N values, or a scalar for a single controller bank)"""
+        scalar = np.ndim(error) == 0 and self.n == 1
+        error = np.asarray(error, dtype=np.float64)
+
+        # Derivative component
+        if self.error_prev is not None:
+            error_der = (error - self.error_prev) / self.Ts
+            if self.filtered:
+                error_der = self.alpha * self.error_der + (1 - self.alpha) * error_der
+        else:
+            error_der = np.zeros_like(self.kp)
+        self.error_prev = error
+        self.error_der = error_der
+
+        # Integral component and output
+        error_int = self.error_int + error * self.Ts
+        output = error * self.kp + error_int * self.ki + error_der * self.kd
+        if self.saturated:
+            output_sat = np.clip(output, self.u_min, self.u_max)
+            if self.anti_windup == 'clamping':                                  # Integration frozen while saturating further
+                windup = (output_sat != output) & (np.sign(error) == np.sign(output))
+                if windup.any():
+                    error_int = np.where(windup, self.error_int, error_int)
+                    output_sat = np.clip(error * self.kp + error_int * self.ki + error_der * self.kd, self.u_min, self.u_max)
+            elif self.anti_windup == 'back_calculation':                        # Integral corrected for the next sample
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    correction = np.where(self.ki != 0, self.Ts * self.kt * (output_sat - output) / self.ki, 0)
+                error_int = error_int + correction
+            output = output_sat
+        self.error_int = error_int
+        return float(output[0]) if scalar else output
+
+    def reset(self):
+        """Resets the state of every controller"""
+        self.error_int = np.zeros_like(self.kp)     # Integral components
+        self.error_prev = None                      # Previous errors, None until the first sample
+        self.error_der = np.zeros_like(self.kp)     # (Filtered) derivative components
@@ -0,0 +1,156 @@
+'''
+Title: instrumentation
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Instrumentation class, an optional observer of the Simulation runs. It collects:
+    - Counters: runs, steps, controller calls and plant evaluations.
+    - Per-phase timers: controller update, plant update, fused paths (open loop and compiled backend, which cannot be split) and
+      bookkeeping (everything else in the run: trace writes, monitors and hooks).
+    - Hooks called at the start and end of every run and after every step of the step-by-step loops.
+    - Optionally, a cProfile profile of the runs that can be dumped as pstats.
+    A Simulation without instrumentation runs its usual loops, so the instrumentation costs nothing when it is disabled.
+'''
+import io
+import time
+import pstats
+import cProfile
+
+COUNTERS = ('runs', 'steps', 'controller_calls', 'plant_evaluations')
+PHASES = ('controller', 'plant', 'fused', 'bookkeeping')
+EVENTS = ('run_start', 'step', 'run_end')
+
+class _Raw_Profile:
+    """Profile data received from a worker process, in the form accepted by pstats.Stats"""
+    def __init__(self, stats:dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Instrumentation:
+    """Counters, per-phase timers, hooks and profiling of Simulation runs"""
+    def __init__(self, timers:bool=True, profile:bool=False):
+        """timers: measure the time spent in every phase. profile: run every simulation under cProfile"""
+        self.timers = timers        # Per-phase timing enabled
+        self.profile = profile      # cProfile enabled
+        self.hooks = {event:[] for event in EVENTS}   # Callbacks per event
+        self.reset()
+
+    def reset(self):
+        """Discards the collected counters, timers and profiles. Hooks are kept"""
+        self.counters = dict.fromkeys(COUNTERS, 0)          # Totals over all the runs
+        self.times = dict.fromkeys(PHASES + ('run',), 0.0)  # Totals over all the runs [s]
+        self.last_run = None                                # Counters and times of the last run
+        self._profiler = None
+        self._profiles = []                                 # Profiles merged from other instances
+        self._current = None                                # Counters and times of the run in progress
+        self._start = None
+
+    def add_hook(self, event:str, callback):
+        """Registers a callback for an event:
+            - 'run_start', 'run_end': callback(simulation)
+            - 'step': callback(simulation, k, t, velocity, error, Fc), called after every step of the step-by-step loops (not by the fused paths)"""
+        if event not in EVENTS:
+            raise ValueError(f'Unknown event {event!r}, available: {EVENTS}')
+        self.hooks[event].append(callback)
+
+    def begin_run(self, simulation):
+        """Called by the Simulation when a run starts"""
+        for callback in self.hooks['run_start']:
+            callback(simulation)
+        self._current = dict.fromkeys(COUNTERS, 0)
+        self._current.update(dict.fromkeys(PHASES, 0.0))
+        self._current['runs'] = 1
+        if self.profile:
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter() if self.timers else None
+
+    def count(self, steps:int=0, controller_calls:int=0, plant_evaluations:int=0, **phase_times):
+        """Called by the Simulation loops to report their counters and the time spent in each phase [s]"""
+        current = self._current
+        current['steps'] += steps
+        current['controller_calls'] += controller_calls
+        current['plant_evaluations'] += plant_evaluations
+        for phase, elapsed in phase_times.items():
+            current[phase] += elapsed
+
+    def end_run(self, simulation):
+        """Called by the Simulation when a run finishes or is interrupted"""
+        if self._start is not None:
+            run_time = time.perf_counter() - self._start
+        else:
+            run_time = 0.0
+        if self.profile:
+            self._profiler.disable()
+        current = self._current
+        current['run'] = run_time
+        if self.timers:
+            current['bookkeeping'] = max(0.0, run_time - current['controller'] - current['plant'] - current['fused'])
+        for counter in COUNTERS:
+            self.counters[counter] += current[counter]
+        for phase in self.times:
+            self.times[phase] += current[phase]
+        self.last_run = current
+        self._current = None
+        for callback in self.hooks['run_end']:
+            callback(simulation)
+
+    def spawn(self, hooks:bool=True):
+        """New empty instrumentation with the same settings, used per chunk in the sweeps. Hooks are not shared when the instance
+        must be sent to a worker process"""
+        child = Instrumentation(timers=self.timers, profile=self.profile)
+        if hooks:
+            child.hooks = self.hooks
+        return child
+
+    def snapshot(self) -> dict:
+        """Picklable copy of the collected counters, timers and profiles, see merge"""
+        profiles = list(self._profiles)
+        if self._profiler is not None:
+            profiles.append(pstats.Stats(self._profiler).stats)
+        return {'counters':dict(self.counters), 'times':dict(self.times), 'profiles':profiles}
+
+    def merge(self, snapshot:dict):
+        """Adds the counters, timers and profiles of another instance (given as a snapshot, e.g. coming from a worker process)"""
+        for counter, value in snapshot['counters'].items():
+            self.counters[counter] += value
+        for phase, value in snapshot['times'].items():
+            self.times[phase] += value
+        self._profiles.extend(snapshot['profiles'])
+
+    def get_stats(self) -> pstats.Stats:
+        """pstats.Stats with the profile of all the runs (including the merged ones)"""
+        sources = [_Raw_Profile(stats) for stats in self._profiles]
+        if self._profiler is not None:
+            sources.insert(0, self._profiler)
+        if not sources:
+            raise ValueError('No profile available, enable it with profile=True.')
+        return pstats.Stats(*sources)
+
+    def dump_stats(self, path:str):
+        """Writes the profile in the pstats format (readable with pstats, snakeviz, etc.)"""
+        self.get_stats().dump_stats(path)
+
+    def summary(self, last_run:bool=False, top:int=10) -> str:
+        """Text report of the totals (or of the last run) with the time per phase and, when profiling, the top functions by cumulative time"""
+        data = self.last_run if last_run else {**self.counters, **self.times}
+        if data is None:
+            return 'No run recorded.'
+        lines = [f"Runs: {data['runs']}, steps: {data['steps']}, controller calls: {data['controller_calls']}, plant evaluations: {data['plant_evaluations']}"]
+        if self.timers:
+            run_time = data['run']
+            per_step = run_time / data['steps'] * 1e6 if data['steps'] else 0.0
+            lines.append(f'Run time: {run_time * 1e3:.3f} ms ({per_step:.3f} us/step)')
+            for phase in PHASES:
+                share = data[phase] / run_time * 100 if run_time else 0.0
+                lines.append(f'  {phase:<12} {data[phase] * 1e3:10.3f} ms {share:6.1f}%')
+        if self.profile and not last_run and top:
+            stream = io.StringIO()
+            stats = self.get_stats()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(top)
+            lines.append(stream.getvalue())
+        return '\n'.join(lines)
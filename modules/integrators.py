@@ -0,0 +1,116 @@
+'''
+Title: integrators
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the definitions of the integrator abstract class and the integrators used to advance the vehicle dynamics
+            between two controller samples (the controller output is held constant, zero-order hold):
+    - Euler_Integrator: explicit Euler with a fixed number of substeps
+    - RK4_Integrator: classic 4th order Runge-Kutta with a fixed number of substeps
+    - RK45_Integrator: adaptive-step Dormand-Prince 5(4) method, 6 plant evaluations per accepted step (first same as last)
+'''
+from abc import ABC, abstractmethod
+
+class Integrator(ABC):
+    """Parent class to define a template and a clear interface with integrators"""
+    def __init__(self):
+        self.n_evaluations = 0  # Number of evaluations of the dynamics (plant evaluations)
+
+    @abstractmethod
+    def integrate(self, f, v:float, dt:float) -> float:
+        """Integrates dv/dt = f(v) over dt starting from v and returns the final value"""
+        pass
+
+    def reset(self):
+        """Resets the evaluation counter"""
+        self.n_evaluations = 0
+
+class Euler_Integrator(Integrator):
+    """Explicit Euler method with a fixed internal step dt/substeps. With substeps=1 it is equivalent to Vehicle.update"""
+    def __init__(self, substeps:int=1):
+        super().__init__()
+        if not isinstance(substeps, int) or substeps < 1:
+            raise ValueError('substeps must be a positive integer.')
+        self.substeps = substeps    # Number of internal steps per call
+
+    def integrate(self, f, v, dt):
+        h = dt / self.substeps
+        for _ in range(self.substeps):
+            v = v + f(v) * h
+        self.n_evaluations += self.substeps
+        return v
+
+class RK4_Integrator(Integrator):
+    """Classic 4th order Runge-Kutta method with a fixed internal step dt/substeps"""
+    def __init__(self, substeps:int=1):
+        super().__init__()
+        if not isinstance(substeps, int) or substeps < 1:
+            raise ValueError('substeps must be a positive integer.')
+        self.substeps = substeps    # Number of internal steps per call
+
+    def integrate(self, f, v, dt):
+        h = dt / self.substeps
+        for _ in range(self.substeps):
+            k1 = f(v)
+            k2 = f(v + 0.5 * h * k1)
+            k3 = f(v + 0.5 * h * k2)
+            k4 = f(v + h * k3)
+            v = v + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        self.n_evaluations += 4 * self.substeps
+        return v
+
+class RK45_Integrator(Integrator):
+    """Adaptive-step Dormand-Prince 5(4) method. The step size is controlled with the local error estimate and carried over between calls.
+    The last stage of an accepted step is the derivative at its end, so it is reused as the first stage of the next step of the same call"""
+    # Butcher tableau
+    A = ((),
+         (1/5,),
+         (3/40, 9/40),
+         (44/45, -56/15, 32/9),
+         (19372/6561, -25360/2187, 64448/6561, -212/729),
+         (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+         (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84))
+    B = (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0)                             # 5th order weights
+    E = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)                 # 5th minus 4th order weights
+
+    def __init__(self, rtol:float=1e-6, atol:float=1e-9, h0:float=None):
+        super().__init__()
+        if rtol <= 0 or atol <= 0:
+            raise ValueError('rtol and atol must be positive.')
+        self.rtol = rtol            # Relative tolerance
+        self.atol = atol            # Absolute tolerance [m/s]
+        self.h0 = h0                # Initial step [s], None to start with the full interval
+        self.h = h0                 # Current step [s]
+        self.n_rejected = 0         # Number of rejected steps
+
+    def reset(self):
+        super().reset()
+        self.h = self.h0
+        self.n_rejected = 0
+
+    def integrate(self, f, v, dt):
+        t = 0
+        h = dt if self.h is None else min(self.h, dt)
+        k_first = None          # Derivative at v, carried over from the last accepted step (f changes between calls)
+        while t < dt:
+            h = min(h, dt - t)
+            if k_first is None:
+                k_first = f(v)
+                self.n_evaluations += 1
+            k = [k_first]
+            for a in self.A[1:]:    # Stages
+                k.append(f(v + h * sum(a_j * k_j for a_j, k_j in zip(a, k))))
+            self.n_evaluations += len(self.A) - 1
+            v_new = v + h * sum(b_j * k_j for b_j, k_j in zip(self.B, k))
+            error = h * sum(e_j * k_j for e_j, k_j in zip(self.E, k))
+            scale = self.atol + self.rtol * max(abs(v), abs(v_new))
+            ratio = abs(error) / scale
+            if ratio <= 1 or not ratio < float('inf'):  # Step accepted (diverging solutions are accepted and propagated as inf/nan)
+                t += h
+                v = v_new
+                k_first = k[-1]                         # Evaluated at v_new (the last row of A is B)
+            else:
+                self.n_rejected += 1
+            h = h * min(5, max(0.2, 0.9 * ratio ** -0.2)) if 0 < ratio < float('inf') else 5 * h
+            self.h = h
+        return v
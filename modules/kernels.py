@@ -0,0 +1,75 @@
+'''
+Title: kernels
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the compiled backend of the Simulation. The vehicle dynamics, the PID update and the trace writes of a
+            whole run are fused in a single kernel, compiled with Numba when it is installed. Without Numba the same kernel runs as plain
+            Python, which still avoids the attribute lookups and method calls of the step-by-step loop.
+            The kernel performs exactly the same floating-point operations as Vehicle.update and PID_Discrete_Controller.update, so the
+            results are bit-for-bit identical to the Python backend.
+'''
+import math
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        """Fallback decorator: the function is used as plain Python"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+@njit(cache=True)
+def closed_loop_kernel(velocity, mass, k_kgpm, target_velocity, has_controller, kp, ki, kd, Ts, error_int, error_prev, has_error_prev,
+                       dt, n_steps, data, decimation, written, error_thr, first_time, last_above, last_outside, non_finite, max_abs_velocity):
+    """Simulates n_steps steps writing every decimation-th sample (time, velocity, error [%], force) in the ring storage data (4 x capacity),
+    starting at the written-th sample, and updating the settling and divergence state of Trace_Buffer (times are NaN when there is no
+    such sample, error_thr NaN to not track them).
+    Returns the final velocity, the final controller state, the updated written count and the tracked state"""
+    capacity = data.shape[1]
+    track = error_thr == error_thr                                      # Not NaN
+    for k in range(n_steps):
+        error = target_velocity - velocity                              # Absolute error
+        if has_controller:                                              # PID_Discrete_Controller.update
+            error_int = error_int + error
+            if has_error_prev:
+                error_der = (error - error_prev) / Ts
+            else:
+                error_der = 0.0
+            error_prev = error
+            has_error_prev = True
+            Fc = error * kp + error_int * ki + error_der * kd
+        else:                                                           # No_Controller.update
+            Fc = 0.0
+        if k % decimation == 0:                                         # Trace write
+            i = written % capacity
+            data[0, i] = k * dt
+            data[1, i] = velocity
+            data[2, i] = error / target_velocity * 100
+            data[3, i] = Fc
+            written += 1
+            if track:                                                   # Trace_Buffer._track
+                error_pct = data[2, i]
+                if first_time != first_time:
+                    first_time = k * dt
+                if error_pct > error_thr:
+                    last_above = k * dt
+                if not abs(error_pct) <= error_thr:
+                    last_outside = k * dt
+                if not (math.isfinite(velocity) and math.isfinite(error_pct) and math.isfinite(Fc)):
+                    non_finite = True
+                elif abs(velocity) > max_abs_velocity:
+                    max_abs_velocity = abs(velocity)
+        if velocity > 0:                                                # np.sign(velocity)
+            sign = 1.0
+        elif velocity < 0:
+            sign = -1.0
+        elif velocity == 0:
+            sign = 0.0
+        else:
+            sign = velocity
+        drag = -sign * k_kgpm * velocity ** 2                           # Vehicle.get_drag
+        velocity = velocity + (Fc + drag) / mass * dt                   # Vehicle.update
+    return velocity, error_int, error_prev, has_error_prev, written, first_time, last_above, last_outside, non_finite, max_abs_velocity
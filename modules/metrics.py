@@ -0,0 +1,105 @@
+'''
+Title: metrics
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the vectorized performance metrics of the closed-loop response. All the metrics of many runs are computed
+            at once from 2-D trace arrays (runs x time) and returned as a structured array (METRICS_DTYPE), one record per run:
+    - settled: the error ends inside the two-sided band +-error_thr. settling_time: time of the last sample outside the band (the first
+      sample if it never left the band), NaN if the run did not settle.
+    - overshoot: largest excursion past the target, in the direction opposite to the initial error [% of the target velocity].
+    - rise_time: time to go from 10% to 90% of the initial error towards the target [s], NaN if not reached.
+    - steady_state_error: mean error over the last steady_state_fraction of the run [%].
+    - iae, ise, itae: integrals of |error|, error^2 and t*|error| [%s, %^2s, %s^2], with t measured from the start of the run.
+    - control_effort: integral of the squared controller output [N^2s]. peak_force: largest absolute controller output [N].
+    Runs with non-finite samples (or faster than divergence_velocity) are flagged as diverged: they are not settled, their times are NaN
+    and their overshoot, integrals and effort are infinite.
+'''
+import numpy as np
+
+METRICS_DTYPE = np.dtype([('settled', np.bool_), ('diverged', np.bool_), ('settling_time', np.float64), ('overshoot', np.float64),
+                          ('rise_time', np.float64), ('steady_state_error', np.float64), ('iae', np.float64), ('ise', np.float64),
+                          ('itae', np.float64), ('control_effort', np.float64), ('peak_force', np.float64)])
+
+def _first_index(mask):
+    """Index of the first True of every row, and whether the row has any"""
+    return np.argmax(mask, axis=1), mask.any(axis=1)
+
+def compute_metrics(time, error, force=None, error_thr:float=1, velocity=None, divergence_velocity:float=None,
+                    steady_state_fraction:float=0.1, rise_band=(0.1, 0.9)) -> np.ndarray:
+    """Metrics of every run. time: shared time vector (T,) or one per run (N x T). error: errors [%] (N x T), a single run (T,) gives a
+    single record. force: controller outputs (N x T), None to skip the effort metrics (NaN). velocity and divergence_velocity: optional
+    divergence check on the speed [m/s]"""
+    single = np.ndim(error) == 1
+    error = np.atleast_2d(np.asarray(error, dtype=np.float64))
+    n_runs, n_samples = error.shape
+    time = np.broadcast_to(np.asarray(time, dtype=np.float64), error.shape)
+    if n_samples == 0:
+        raise ValueError('The traces are empty.')
+    if not 0 < steady_state_fraction <= 1:
+        raise ValueError('steady_state_fraction must be in (0, 1].')
+
+    # Sample durations (zero-order hold), the last sample lasts as long as the previous one
+    if n_samples > 1:
+        dt = np.diff(time, axis=1)
+        dt = np.concatenate((dt, dt[:, -1:]), axis=1)
+    else:
+        dt = np.ones_like(time)
+    elapsed = time - time[:, :1]
+
+    # Divergence
+    diverged = ~np.all(np.isfinite(error), axis=1)
+    if force is not None:
+        force = np.broadcast_to(np.asarray(force, dtype=np.float64), error.shape)
+        diverged |= ~np.all(np.isfinite(force), axis=1)
+    if velocity is not None:
+        velocity = np.broadcast_to(np.asarray(velocity, dtype=np.float64), error.shape)
+        with np.errstate(invalid='ignore'):
+            diverged |= ~np.all(np.isfinite(velocity), axis=1)
+            if divergence_velocity is not None:
+                diverged |= np.any(np.abs(velocity) > divergence_velocity, axis=1)
+
+    result = np.zeros(n_runs, dtype=METRICS_DTYPE)
+    with np.errstate(over='ignore', invalid='ignore'):
+        abs_error = np.abs(error)
+
+        # Two-sided settling
+        outside = ~(abs_error <= error_thr)                                         # NaN samples count as outside
+        last_outside = n_samples - 1 - np.argmax(outside[:, ::-1], axis=1)
+        settling_index = np.where(outside.any(axis=1), last_outside, 0)
+        settled = ~outside[:, -1] & ~diverged
+        result['settled'] = settled
+        result['settling_time'] = np.where(settled, time[np.arange(n_runs), settling_index], np.nan)
+
+        # Overshoot: excursion with the opposite sign of the initial error (any excursion if the run starts at the target)
+        initial_sign = np.sign(error[:, :1])
+        excursion = np.where(initial_sign == 0, abs_error, -initial_sign * error)
+        result['overshoot'] = np.clip(np.max(excursion, axis=1), 0, None)
+
+        # Rise time: remaining fraction of the initial error goes from 1 to 0 when reaching the target
+        fraction = error / np.where(error[:, :1] != 0, error[:, :1], np.nan)
+        low_index, low_reached = _first_index(fraction <= 1 - rise_band[0])
+        high_index, high_reached = _first_index(fraction <= 1 - rise_band[1])
+        rows = np.arange(n_runs)
+        result['rise_time'] = np.where(low_reached & high_reached, time[rows, high_index] - time[rows, low_index], np.nan)
+
+        # Steady-state error and integral criteria
+        n_tail = max(1, int(np.ceil(steady_state_fraction * n_samples)))
+        result['steady_state_error'] = np.mean(error[:, -n_tail:], axis=1)
+        result['iae'] = np.sum(abs_error * dt, axis=1)
+        result['ise'] = np.sum(error ** 2 * dt, axis=1)
+        result['itae'] = np.sum(elapsed * abs_error * dt, axis=1)
+        if force is not None:
+            result['control_effort'] = np.sum(force ** 2 * dt, axis=1)
+            result['peak_force'] = np.max(np.abs(force), axis=1)
+        else:
+            result['control_effort'] = np.nan
+            result['peak_force'] = np.nan
+
+    # Diverged runs
+    result['diverged'] = diverged
+    for field in ('rise_time', 'steady_state_error'):
+        result[field][diverged] = np.nan
+    for field in ('overshoot', 'iae', 'ise', 'itae') + (('control_effort', 'peak_force') if force is not None else ()):
+        result[field][diverged] = np.inf
+    return result[0] if single else result
@@ -0,0 +1,43 @@
+'''
+Title: monitoring
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Settling_Monitor class, an incremental (sample by sample) detector of settling and divergence used
+            to stop streamed simulations early.
+'''
+import math
+
+class Settling_Monitor:
+    """Incremental settling and divergence detection"""
+    SETTLED = 'settled'
+    DIVERGED = 'diverged'
+
+    def __init__(self, error_thr:float, hold_time:float=None, divergence_velocity:float=None):
+        """hold_time: time the error must stay within +-error_thr to consider the vehicle settled [s], None to never stop on settling.
+        divergence_velocity: speed above which the vehicle is considered diverged [m/s], None to only stop on non-finite velocities"""
+        if hold_time is not None and hold_time < 0:
+            raise ValueError('hold_time cannot be negative.')
+        self.error_thr = error_thr                      # Error threshold [%]
+        self.hold_time = hold_time                      # Hold window [s]
+        self.divergence_velocity = divergence_velocity  # Divergence speed [m/s]
+        self.reset()
+
+    def reset(self):
+        self.settling_time = None   # Time of the last sample outside the error band, None if no sample was outside [s]
+        self.t_first = None         # Time of the first sample [s]
+        self.status = None          # None while running, SETTLED or DIVERGED
+
+    def update(self, t:float, velocity:float, error:float):
+        """Processes one sample (error in %) and returns the current status"""
+        if self.t_first is None:
+            self.t_first = t
+        if not math.isfinite(velocity) or (self.divergence_velocity is not None and abs(velocity) > self.divergence_velocity):
+            self.status = self.DIVERGED
+        elif abs(error) > self.error_thr:       # Two-sided band check
+            self.settling_time = t
+        elif self.hold_time is not None:
+            since = self.t_first if self.settling_time is None else self.settling_time
+            if t - since >= self.hold_time:
+                self.status = self.SETTLED
+        return self.status
@@ -0,0 +1,118 @@
+'''
+Title: monte_carlo
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Monte_Carlo class, used to estimate the settling time distribution of a vehicle and its PID controller
+            under uncertainty: mass and drag constant errors, initial velocity spread, sensor noise, actuator saturation and external force
+            disturbances. Scenarios are drawn in batches from reproducible random streams (one per batch, derived from the seed, so the
+            results do not depend on the number of processes), simulated with Batch_Simulation, and aggregated in a fixed-size histogram
+            as the batches finish, so no trace is kept.
+'''
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from modules.batch_simulation import Batch_Simulation
+from modules.metrics import compute_metrics
+from modules.trace import get_n_steps
+
+class Settling_Statistics:
+    """Streaming aggregation of settling times. Settling times are multiples of dt, so one histogram bin per time step is exact"""
+    def __init__(self, dt:float, sim_time:float):
+        self.dt = dt
+        self.counts = np.zeros(get_n_steps(sim_time, dt), dtype=np.int64)     # Settled runs per settling time step
+        self.n_runs = 0                                                         # Number of aggregated runs
+        self.n_failures = 0                                                     # Runs that did not settle or diverged
+
+    def add(self, settling_step):
+        """Aggregates a batch of settling times given as step indices, -1 for failed runs"""
+        settling_step = np.asarray(settling_step)
+        failed = settling_step < 0
+        self.n_runs += len(settling_step)
+        self.n_failures += int(np.count_nonzero(failed))
+        self.counts += np.bincount(settling_step[~failed], minlength=len(self.counts))
+
+    def percentile(self, q):
+        """Settling time percentile(s) of the settled runs [s], NaN if no run settled"""
+        q = np.asarray(q, dtype=np.float64)
+        n_settled = self.n_runs - self.n_failures
+        if n_settled == 0:
+            return np.full(q.shape, np.nan)
+        cumulative = np.cumsum(self.counts)
+        step = np.searchsorted(cumulative, np.ceil(q / 100 * n_settled).clip(1, None))   # Nearest-rank percentile
+        return step * float(self.dt)
+
+    def mean(self):
+        """Mean settling time of the settled runs [s]"""
+        n_settled = self.n_runs - self.n_failures
+        return float(np.dot(self.counts, np.arange(len(self.counts))) * self.dt / n_settled) if n_settled else np.nan
+
+def get_settling_step(error, error_thr):
+    """Settling step of each run: index after which the error stays within +-error_thr (two-sided band), -1 if the last sample is
+    outside the band or the run diverged"""
+    metrics = compute_metrics(np.arange(error.shape[1]), error, error_thr=error_thr)   # Time axis in steps
+    return np.where(metrics['settled'], metrics['settling_time'], -1).astype(np.int64)
+
+def _run_batch(args):
+    """Worker entry point: draws and simulates one batch of scenarios. Returns the settling steps"""
+    config, batch_index, batch_size = args
+    rng = np.random.default_rng(np.random.SeedSequence(config['seed'], spawn_key=(batch_index,)))
+    mass = config['mass'] * (1 + config['mass_std'] * rng.standard_normal(batch_size)).clip(0.1, None)
+    k_kgpm = config['k_kgpm'] * (1 + config['k_kgpm_std'] * rng.standard_normal(batch_size)).clip(0, None)
+    initial_velocity = config['initial_velocity'] + config['initial_velocity_std'] * rng.standard_normal(batch_size)
+    disturbance_force = config['disturbance_std'] * rng.standard_normal(batch_size)
+    batch = Batch_Simulation(mass=mass, initial_velocity=initial_velocity, k_kgpm=k_kgpm, kp=config['kp'], ki=config['ki'], kd=config['kd'], Ts=config['Ts'],
+                             target_velocity=config['target_velocity'], dt=config['Ts'], sim_time=config['sim_time'], error_thr=config['error_thr'],
+                             force_limit=config['force_limit'], disturbance_force=disturbance_force, sensor_noise_std=config['sensor_noise_std'], rng=rng)
+    with np.errstate(over='ignore', invalid='ignore'):
+        batch.run()
+        return get_settling_step(batch.error, config['error_thr'])
+
+class Monte_Carlo:
+    """Monte Carlo analysis of the settling time of a vehicle with a PID_Discrete_Controller under uncertainty"""
+    def __init__(self, mass:float=1, k_kgpm:float=0.05, initial_velocity:float=10, target_velocity:float=5, kp:float=0.28, ki:float=0.12, kd:float=0.05,
+                 Ts:float=1, sim_time:float=50, error_thr:float=1, mass_std:float=0, k_kgpm_std:float=0, initial_velocity_std:float=0,
+                 sensor_noise_std:float=0, disturbance_std:float=0, force_limit:float=np.inf, settling_requirement:float=None, seed:int=0):
+        """Nominal scenario and uncertainty definition:
+            - mass_std, k_kgpm_std: relative standard deviations of the mass and drag constant
+            - initial_velocity_std: standard deviation of the initial velocity [m/s]
+            - sensor_noise_std: standard deviation of the velocity measurement noise, drawn at every step [m/s]
+            - disturbance_std: standard deviation of a constant external force drawn per scenario [N]
+            - force_limit: controller output saturation [N]
+            - settling_requirement: runs settling later than this are counted as failures [s], None to only count unsettled runs"""
+        self.config = {'mass':mass, 'k_kgpm':k_kgpm, 'initial_velocity':initial_velocity, 'target_velocity':target_velocity, 'kp':kp, 'ki':ki, 'kd':kd,
+                       'Ts':Ts, 'sim_time':sim_time, 'error_thr':error_thr, 'mass_std':mass_std, 'k_kgpm_std':k_kgpm_std,
+                       'initial_velocity_std':initial_velocity_std, 'sensor_noise_std':sensor_noise_std, 'disturbance_std':disturbance_std,
+                       'force_limit':force_limit, 'seed':seed}
+        self.settling_requirement = settling_requirement
+
+    def run(self, n_scenarios:int, batch_size:int=1000, processes:int=1, percentiles=(50, 90, 95, 99)):
+        """Simulates n_scenarios scenarios in batches, serially (processes=1) or in a process pool (None uses all the cores).
+        Returns a dictionary with the failure rate, the settling time percentiles and the mean settling time of the settled runs"""
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if n_scenarios < 1:
+            raise ValueError('n_scenarios must be a positive integer.')
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer.')
+        if processes < 1:
+            raise ValueError('processes must be a positive integer.')
+        n_batches = -(-n_scenarios // batch_size)
+        jobs = [(self.config, i, min(batch_size, n_scenarios - i * batch_size)) for i in range(n_batches)]
+        statistics = Settling_Statistics(dt=self.config['Ts'], sim_time=self.config['sim_time'])
+        if processes == 1 or n_batches <= 1:
+            for job in jobs:
+                statistics.add(self._apply_requirement(_run_batch(job)))
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, n_batches)) as executor:
+                for settling_step in executor.map(_run_batch, jobs):
+                    statistics.add(self._apply_requirement(settling_step))
+        self.statistics = statistics
+        return {'n_scenarios':statistics.n_runs, 'failure_rate':statistics.n_failures / statistics.n_runs,
+                'percentiles':dict(zip(percentiles, statistics.percentile(percentiles).tolist())), 'mean':statistics.mean()}
+
+    def _apply_requirement(self, settling_step):
+        """Marks the runs settling later than the requirement as failures"""
+        if self.settling_requirement is None:
+            return settling_step
+        return np.where(settling_step * self.config['Ts'] > self.settling_requirement, -1, settling_step)
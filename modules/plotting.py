@@ -0,0 +1,105 @@
+'''
+Title: plotting
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the headless reporting tools. Plots are drawn on explicit matplotlib Figure/Axes objects rendered with
+            the Agg backend, so they never open or block on a GUI window. Long traces are downsampled (keeping the minimum and maximum
+            of every bucket) before drawing, and the figures of a whole sweep can be rendered in a worker pool.
+'''
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+MAX_POINTS = 2000   # Default number of points drawn per trace
+
+def downsample(time, values, max_points:int=MAX_POINTS):
+    """Reduces a trace to about max_points samples keeping the minimum and the maximum of every bucket, so peaks remain visible"""
+    time, values = np.asarray(time), np.asarray(values)
+    n = len(time)
+    if max_points is None or n <= max_points:
+        return time, values
+    bucket = int(np.ceil(2 * n / max_points))
+    n_buckets = n // bucket
+    body = values[:n_buckets * bucket].reshape(n_buckets, bucket)
+    offsets = np.arange(n_buckets) * bucket
+    index = np.unique(np.concatenate((offsets + np.argmin(body, axis=1), offsets + np.argmax(body, axis=1), np.arange(n_buckets * bucket, n))))
+    return time[index], values[index]
+
+def new_figure(n_axes:int=1, figsize=(6.4, 4.8)):
+    """Creates a Figure attached to an Agg canvas, independent of pyplot and of any GUI. Returns the figure and its axes"""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(n_axes, 1, squeeze=False)[:, 0]
+    return fig, axes
+
+def plot_velocity(ax, time, velocity, label:str='', max_points:int=MAX_POINTS):
+    """Plots a velocity trace on the given axes"""
+    t, v = downsample(time, velocity, max_points)
+    ax.plot(t, v, label=label, rasterized=len(t) < len(time))
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Velocity [m/s]')
+    ax.grid(visible=True)
+    ax.legend()
+
+def plot_error(ax, time, error, label:str='', max_points:int=MAX_POINTS):
+    """Plots a velocity error trace on the given axes"""
+    t, e = downsample(time, error, max_points)
+    ax.plot(t, e, label=label, rasterized=len(t) < len(time))
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Velocity Error [%]')
+    ax.grid(visible=True)
+    ax.legend()
+
+def plot_velocity_sp(ax, target_velocity:float):
+    """Plots the velocity setpoint on the given axes"""
+    ax.axhline(target_velocity, color='magenta', linestyle='--', label=f'Target velocity:{target_velocity}m/s')
+    ax.legend()
+
+def plot_error_band(ax, error_thr:float):
+    """Plots the velocity error band on the given axes"""
+    ax.axhline(error_thr, color='red', label=f'$\\pm${error_thr}% limit')
+    ax.axhline(-error_thr, color='red')
+    ax.legend()
+
+def make_job(simulation, name:str, title:str=''):
+    """Extracts from a Simulation the data needed to render its report, so it can be sent to a worker process"""
+    return {'name':name, 'title':title, 'time':simulation.time, 'velocity':simulation.velocity, 'error':simulation.error,
+            'target_velocity':simulation.target_velocity, 'error_thr':simulation.error_thr, 'settling_time':simulation.get_settling_time()}
+
+def render_job(job:dict, output_dir:str='output', formats=('png',), max_points:int=MAX_POINTS):
+    """Renders the velocity and error plots of one run in a single figure and saves it in every format. Returns the written paths"""
+    fig, (ax_velocity, ax_error) = new_figure(n_axes=2, figsize=(6.4, 8))
+    plot_velocity(ax_velocity, job['time'], job['velocity'], label='Velocity profile', max_points=max_points)
+    plot_velocity_sp(ax_velocity, job['target_velocity'])
+    plot_error(ax_error, job['time'], job['error'], label='Velocity error profile', max_points=max_points)
+    plot_error_band(ax_error, job['error_thr'])
+    ax_velocity.set_title(job['title'] or f'{job["name"]} (Settling time:{job["settling_time"]}s, Error band {job["error_thr"]}%)')
+    fig.tight_layout()
+    paths = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f'{job["name"]}.{fmt}')
+        fig.savefig(path)
+        paths.append(path)
+    return paths
+
+def _render_job(args):
+    """Worker entry point"""
+    job, output_dir, formats, max_points = args
+    return render_job(job, output_dir=output_dir, formats=formats, max_points=max_points)
+
+def render_sweep(jobs, output_dir:str='output', formats=('png',), processes:int=None, max_points:int=MAX_POINTS):
+    """Renders the reports of a whole sweep (a list of jobs built with make_job) in a worker pool. Returns the written paths.
+    processes=1 renders serially in the calling process, None uses all the available cores"""
+    os.makedirs(output_dir, exist_ok=True)
+    args = [(job, output_dir, tuple(formats), max_points) for job in jobs]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(args) <= 1:
+        paths = [_render_job(a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(args))) as executor:
+            paths = list(executor.map(_render_job, args))
+    return [path for job_paths in paths for path in job_paths]
@@ -0,0 +1,219 @@
+'''
+Title: result_cache
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Result_Cache class, a persistent on-disk cache of simulation results. Every result is stored under
+            a stable hash of the full simulation configuration (vehicle, controller and integrator classes and attributes, target velocity,
+            dt, sim_time, error threshold and trace settings), so a cached configuration is never simulated again.
+            The results (settling time, final velocity and optionally the traces with the trace buffer state) are kept in a SQLite database, which serializes the
+            writes of concurrent processes (e.g. process-pool workers). The cache is bounded in size: when it grows beyond max_bytes the
+            least recently used results are evicted.
+'''
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import numpy as np
+from modules.trace import Trace_Buffer
+
+CACHE_VERSION = 2           # Part of every key, changing it invalidates the stored results
+ENTRY_OVERHEAD = 64         # Approximate size of a result without traces [bytes]
+DIAGNOSTIC_COUNTERS = ('n_evaluations', 'n_rejected')   # Integrator counters that do not affect the results, left out of the keys
+TRACE_STATE = ('written',) + Trace_Buffer.TRACKED   # Trace buffer state stored in front of the traces, so a wrapped ring is restored exactly
+
+def _to_json(value):
+    """JSON encoding of the NumPy values found in the configurations"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Cannot hash a value of type {type(value).__name__}')
+
+def _normalize(value):
+    """Integers are hashed as floats, so that e.g. mass=1 and mass=1.0 give the same key"""
+    if isinstance(value, dict):
+        return {key:_normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _normalize(value.tolist())
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+        return float(value)
+    return value
+
+def _encode_state(state:dict) -> np.ndarray:
+    """Trace buffer state as float64 values (NaN for None), all NaN when the state is unknown"""
+    if state is None:
+        return np.full(len(TRACE_STATE), np.nan)
+    return np.array([np.nan if state[name] is None else float(state[name]) for name in TRACE_STATE])
+
+def _decode_state(values:np.ndarray) -> dict:
+    """Inverse of _encode_state, None when the state is unknown"""
+    if np.isnan(values).all():
+        return None
+    state = {name:(None if np.isnan(value) else float(value)) for name, value in zip(TRACE_STATE, values)}
+    state['written'] = int(state['written'])
+    state['non_finite'] = bool(state['non_finite'])
+    return state
+
+def trace_state(trace:Trace_Buffer) -> dict:
+    """State of a trace buffer that is not in its samples: samples written (also those dropped by the ring) and tracked settling state"""
+    return {'written':trace.written, **{name:getattr(trace, name) for name in trace.TRACKED}}
+
+def stable_hash(config:dict) -> str:
+    """Stable hash of a configuration made of dictionaries, lists, strings, numbers and NumPy arrays"""
+    text = json.dumps(_normalize(config), sort_keys=True, default=_to_json)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _describe(component) -> dict:
+    """Class and attributes of a simulation component (vehicle, controller, integrator), without the diagnostic counters. The state that
+    affects the results (e.g. the current step of an adaptive integrator) is kept"""
+    if component is None:
+        return None
+    return {'class':type(component).__name__, **{name:value for name, value in vars(component).items() if name not in DIAGNOSTIC_COUNTERS}}
+
+def simulation_key(simulation) -> str:
+    """Cache key of a Simulation before running it. The controller state is included, the backend is not (backends give the same results)"""
+    return stable_hash({'version':CACHE_VERSION, 'vehicle':_describe(simulation.vehicle), 'controller':_describe(simulation.controller),
+                        'integrator':_describe(simulation.integrator), 'target_velocity':simulation.target_velocity, 'dt':simulation.dt,
+                        'sim_time':simulation.sim_time, 'error_thr':simulation.error_thr, 'open_loop':simulation.open_loop,
+                        'decimation':simulation.trace.decimation, 'window':simulation.trace.window})
+
+class Result_Cache:
+    """Size-bounded LRU cache of simulation results stored in a SQLite database, shared by processes"""
+    def __init__(self, path:str, max_bytes:int=256 * 2**20, timeout:float=60):
+        """path: database file, created if needed. max_bytes: size limit of the stored results. timeout: maximum wait for a lock [s]"""
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be positive.')
+        self.path = path                # Database file
+        self.max_bytes = max_bytes      # Size limit [bytes]
+        self.timeout = timeout          # Lock timeout [s]
+        self.hits = 0                   # Lookups found in the cache (this instance)
+        self.misses = 0                 # Lookups not found in the cache (this instance)
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        """Only the settings are sent to worker processes, each process opens its own connection"""
+        return {'path':self.path, 'max_bytes':self.max_bytes, 'timeout':self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection of the current process, opened on first use"""
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')           # Readers do not block the writer
+            connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, settling_time REAL, final_velocity REAL, '
+                               'traces BLOB, size INTEGER, last_access REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def size(self) -> int:
+        """Total size of the stored results [bytes]"""
+        return self._connect().execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def get(self, key:str, traces:bool=False) -> dict:
+        """Result stored under a key: {'settling_time', 'final_velocity', 'traces', 'state'} with traces as a dictionary of arrays and state
+        the trace buffer state (see trace_state), None if they were not stored. Returns None if the key is missing, or if traces are
+        requested and were not stored"""
+        connection = self._connect()
+        row = connection.execute('SELECT settling_time, final_velocity, traces FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None or (traces and row[2] is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        connection.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+        settling_time, final_velocity = (float('nan') if value is None else value for value in row[:2])   # SQLite stores NaN as NULL
+        data = state = None
+        if row[2] is not None:
+            values = np.frombuffer(row[2], dtype='<f8')
+            state = _decode_state(values[:len(TRACE_STATE)])
+            data = dict(zip(('time', 'velocity', 'error', 'force'), values[len(TRACE_STATE):].reshape(4, -1)))
+        return {'settling_time':settling_time, 'final_velocity':final_velocity, 'traces':data, 'state':state}
+
+    def put(self, key:str, settling_time:float, final_velocity:float=np.nan, traces:dict=None, state:dict=None):
+        """Stores a result (traces: dictionary with the time, velocity, error and force arrays, state: trace buffer state stored with them,
+        see trace_state) and evicts the least recently used results
+        if the cache exceeds max_bytes. Traces already stored under the key are kept when none are given. NaN values (e.g. the final velocity
+        of a diverged run) are stored as NULL and read back as NaN"""
+        blob = None
+        if traces is not None:
+            blob = _encode_state(state).astype('<f8').tobytes()
+            blob += np.stack([np.asarray(traces[field], dtype='<f8') for field in ('time', 'velocity', 'error', 'force')]).tobytes()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')       # Write lock, concurrent writers wait for it
+        try:
+            connection.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                               'settling_time = excluded.settling_time, final_velocity = excluded.final_velocity, '
+                               'traces = COALESCE(excluded.traces, results.traces), '
+                               f'size = {ENTRY_OVERHEAD} + COALESCE(LENGTH(COALESCE(excluded.traces, results.traces)), 0), '
+                               'last_access = excluded.last_access',
+                               (key, float(settling_time), float(final_velocity), blob, ENTRY_OVERHEAD + (len(blob) if blob else 0), time.time()))
+            self._evict(connection)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self, connection:sqlite3.Connection):
+        """Deletes the least recently used results until the cache fits in max_bytes"""
+        excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        keys = []
+        for key, size in connection.execute('SELECT key, size FROM results ORDER BY last_access'):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM results WHERE key = ?', keys)
+
+    def clear(self):
+        """Deletes every stored result"""
+        self._connect().execute('DELETE FROM results')
+
+    def run(self, simulation, traces:bool=False) -> float:
+        """Runs a Simulation through the cache and returns its settling time. On a hit the simulation is skipped: the final vehicle velocity
+        and, with traces=True, the trace buffer (samples and tracked settling state) are restored (the controller state is not). On a miss the Simulation runs and its result
+        is stored, with the traces if traces=True"""
+        key = simulation_key(simulation)
+        result = self.get(key, traces=traces)
+        if result is not None:
+            simulation.initial_velocity = simulation.vehicle.velocity
+            if result['traces'] is not None:
+                trace, state = simulation.trace, result['state']
+                samples = np.stack([result['traces'][field] for field in trace.FIELDS])
+                written = samples.shape[1] if state is None else state['written']
+                start = written % trace.capacity if written > trace.capacity else 0
+                trace.storage()[:, :samples.shape[1]] = np.roll(samples, start, axis=1)     # Oldest sample back at its ring position
+                tracked = None if state is None else {name:state[name] for name in trace.TRACKED}
+                trace.commit(offered=simulation.n_steps, written=written, tracked=tracked)
+            simulation.vehicle.velocity = result['final_velocity']
+            return result['settling_time']
+        simulation.run()
+        settling_time = float(simulation.get_settling_time())
+        trace_data = {field:simulation.trace.get(field) for field in simulation.trace.FIELDS} if traces else None
+        self.put(key, settling_time, final_velocity=simulation.vehicle.velocity, traces=trace_data,
+                 state=trace_state(simulation.trace) if traces else None)
+        return settling_time
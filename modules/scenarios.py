@@ -0,0 +1,206 @@
+'''
+Title: scenarios
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the declarative scenario runner. A YAML, TOML or JSON file describes the scenarios to simulate:
+    - defaults: parameters shared by every scenario (see SCENARIO_DEFAULTS).
+    - scenarios: list of scenarios, each one with a name and the parameters that differ from the defaults.
+    - sweeps: list of sweeps, each one with a name, fixed parameters and a grid {parameter: list of values or {start, stop, step}}.
+      Every point of the cartesian product of the grid becomes a scenario.
+    Every scenario is identified by the hash of the parameters that affect its results (the backend is not one of them). The metrics
+    (<hash>.json) and traces (<hash>.npz) are written to <output>/runs, so scenarios whose results already exist are skipped when the
+    file is run again. A summary.csv with the metrics of all the scenarios of the file is written to the output directory.
+    Run from the root folder with:
+        python -m modules.scenarios config/scenarios.yaml --output output/scenarios --processes 4
+'''
+import os
+import csv
+import json
+import hashlib
+import argparse
+import itertools
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+from modules.integrators import Euler_Integrator, RK4_Integrator, RK45_Integrator
+from modules.simulation import Simulation
+
+SCENARIO_DEFAULTS = {'mass':1, 'initial_velocity':10, 'k_kgpm':0.05, 'target_velocity':5, 'controller':'PID', 'kp':0.28, 'ki':0.12, 'kd':0.05,
+                     'Ts':1, 'dt':1, 'sim_time':50, 'error_thr':1, 'backend':'python', 'integrator':None, 'substeps':1}
+CONTROLLERS = ('PID', 'none')
+INTEGRATORS = (None, 'euler', 'rk4', 'rk45')
+METRICS = ('settling_time', 'final_velocity', 'final_error', 'max_force', 'n_steps')
+
+def load_config(path:str) -> dict:
+    """Reads a scenario file, the format is given by the extension: .json, .toml, .yaml or .yml"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path) as f:
+            return json.load(f)
+    if extension == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is required to read YAML scenario files (pip install pyyaml).')
+        with open(path) as f:
+            return yaml.safe_load(f)
+    raise ValueError(f'Unsupported scenario file format {extension!r}, use .json, .toml, .yaml or .yml')
+
+def _check_parameters(parameters:dict, where:str):
+    """Validates the parameter names and the categorical values"""
+    unknown = set(parameters) - set(SCENARIO_DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown parameters in {where}: {sorted(unknown)}')
+    if parameters.get('controller', 'PID') not in CONTROLLERS:
+        raise ValueError(f'controller must be one of {CONTROLLERS} in {where}.')
+    if parameters.get('integrator') not in INTEGRATORS:
+        raise ValueError(f'integrator must be one of {INTEGRATORS} in {where}.')
+
+def _grid_values(values) -> list:
+    """Values of a grid axis given as a list, a scalar or a {start, stop, step} range (stop excluded)"""
+    if isinstance(values, dict):
+        return np.arange(values['start'], values['stop'], values['step']).tolist()
+    return list(np.atleast_1d(values).tolist())
+
+def expand_scenarios(config:dict) -> list:
+    """List of the scenarios (dictionaries with a name and every parameter) described by a configuration"""
+    unknown = set(config) - {'defaults', 'scenarios', 'sweeps'}
+    if unknown:
+        raise ValueError(f'Unknown sections in the scenario file: {sorted(unknown)}')
+    defaults = dict(SCENARIO_DEFAULTS)
+    _check_parameters(config.get('defaults', {}), 'defaults')
+    defaults.update(config.get('defaults', {}))
+
+    scenarios = []
+    for i, entry in enumerate(config.get('scenarios', [])):
+        parameters = {key:value for key, value in entry.items() if key != 'name'}
+        name = entry.get('name', f'scenario_{i}')
+        _check_parameters(parameters, name)
+        scenarios.append({'name':name, **defaults, **parameters})
+    for i, sweep in enumerate(config.get('sweeps', [])):
+        name = sweep.get('name', f'sweep_{i}')
+        parameters = sweep.get('parameters', {})
+        grid = sweep.get('grid', {})
+        _check_parameters({**parameters, **grid}, name)
+        axes = [_grid_values(values) for values in grid.values()]
+        for j, point in enumerate(itertools.product(*axes)):
+            scenarios.append({'name':f'{name}_{j:04d}', **defaults, **parameters, **dict(zip(grid, point))})
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError('Scenario names must be unique.')
+    return scenarios
+
+def config_hash(scenario:dict) -> str:
+    """Stable hash of the parameters of a scenario that affect its results. The name and the backend (backends give the same results) are
+    not included, nor the gains without controller or the substeps of the integrators that do not use them. Integer and float values hash the same"""
+    ignored = {'name', 'backend'}
+    if scenario.get('controller') == 'none':
+        ignored |= {'kp', 'ki', 'kd', 'Ts'}
+    if scenario.get('integrator') not in ('euler', 'rk4'):
+        ignored.add('substeps')
+    parameters = {key:(float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value)
+                  for key, value in scenario.items() if key not in ignored}
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+def build_simulation(scenario:dict) -> Simulation:
+    """Builds the Vehicle, Controller and Simulation of a scenario"""
+    vehicle = Vehicle(mass=scenario['mass'], initial_velocity=scenario['initial_velocity'], k_kgpm=scenario['k_kgpm'])
+    if scenario['controller'] == 'PID':
+        controller = PID_Discrete_Controller(kp=scenario['kp'], ki=scenario['ki'], kd=scenario['kd'], Ts=scenario['Ts'])
+    else:
+        controller = No_Controller()
+    integrator = {None:lambda: None, 'euler':lambda: Euler_Integrator(substeps=scenario['substeps']),
+                  'rk4':lambda: RK4_Integrator(substeps=scenario['substeps']), 'rk45':lambda: RK45_Integrator()}[scenario['integrator']]()
+    return Simulation(vehicle=vehicle, controller=controller, target_velocity=scenario['target_velocity'], dt=scenario['dt'],
+                      sim_time=scenario['sim_time'], error_thr=scenario['error_thr'], integrator=integrator, backend=scenario['backend'])
+
+def run_scenario(scenario:dict):
+    """Worker entry point: simulates a scenario and returns its metrics and traces"""
+    simEnv = build_simulation(scenario)
+    with np.errstate(over='ignore', invalid='ignore'):     # Unstable scenarios diverge, they are reported with a -1 settling time
+        simEnv.run()
+    metrics = {'settling_time':simEnv.get_settling_time(), 'final_velocity':float(simEnv.vehicle.velocity), 'final_error':float(simEnv.trace.last('error')),
+               'max_force':float(np.max(np.abs(simEnv.force))), 'n_steps':simEnv.n_steps}
+    traces = {'time':simEnv.time, 'velocity':simEnv.velocity, 'error':simEnv.error, 'force':simEnv.force}
+    return metrics, traces
+
+def _write_atomic(path:str, write, mode:str='w'):
+    """Writes a file through a temporary file, so an interrupted run never leaves a partial result. write(f) receives the open file"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def run_config(config:dict, output_dir:str, processes:int=1, backend:str=None, save_traces:bool=True, force:bool=False) -> list:
+    """Runs every scenario of a configuration whose results are not in output_dir yet (all of them with force=True), serially
+    (processes=1) or in a process pool (None uses all the cores). backend overrides the backend of every scenario supported by it (the
+    compiled backend does not support the integrators, those scenarios keep the python backend, which gives the same results).
+    Returns the scenarios with their hash and metrics, in the order of the file, and writes them to output_dir/summary.csv"""
+    scenarios = expand_scenarios(config)
+    if backend is not None:
+        for scenario in scenarios:
+            scenario['backend'] = backend if backend != 'compiled' or scenario['integrator'] is None else 'python'
+    if processes is None:
+        processes = os.cpu_count() or 1
+    runs_dir = os.path.join(output_dir, 'runs')
+    os.makedirs(runs_dir, exist_ok=True)
+
+    pending = []
+    for scenario in scenarios:
+        scenario['hash'] = config_hash(scenario)
+        done = os.path.exists(os.path.join(runs_dir, f"{scenario['hash']}.json"))
+        if save_traces:
+            done = done and os.path.exists(os.path.join(runs_dir, f"{scenario['hash']}.npz"))
+        if force or not done:
+            pending.append(scenario)
+    logging.info(f'{len(scenarios)} scenarios, {len(scenarios) - len(pending)} already done, {len(pending)} to run')
+
+    def collect(scenario, result):
+        """Writes the metrics and traces of a finished scenario"""
+        metrics, traces = result
+        path = os.path.join(runs_dir, scenario['hash'])
+        if save_traces:
+            _write_atomic(f'{path}.npz', lambda f: np.savez(f, **traces), mode='wb')
+        parameters = {key:value for key, value in scenario.items() if key not in ('name', 'hash')}
+        _write_atomic(f'{path}.json', lambda f: json.dump({'parameters':parameters, 'metrics':metrics}, f, indent=2))
+    run_args = [{key:value for key, value in scenario.items() if key != 'hash'} for scenario in pending]
+    if processes == 1 or len(pending) <= 1:
+        for scenario, args in zip(pending, run_args):
+            collect(scenario, run_scenario(args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(pending))) as executor:
+            for scenario, result in zip(pending, executor.map(run_scenario, run_args, chunksize=max(1, len(pending) // (4 * processes)))):
+                collect(scenario, result)
+
+    for scenario in scenarios:
+        with open(os.path.join(runs_dir, f"{scenario['hash']}.json")) as f:
+            scenario.update(json.load(f)['metrics'])
+    with open(os.path.join(output_dir, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'hash', *SCENARIO_DEFAULTS, *METRICS])
+        writer.writeheader()
+        writer.writerows(scenarios)
+    return scenarios
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the scenarios and sweeps described in a YAML, TOML or JSON file')
+    parser.add_argument('config', help='Scenario file')
+    parser.add_argument('--output', default='output/scenarios', help='Output directory (default: output/scenarios)')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes, 0 to use all the cores (default: 1)')
+    parser.add_argument('--backend', choices=('python', 'compiled'), default=None, help='Overrides the backend of every scenario that supports it')
+    parser.add_argument('--no-traces', action='store_true', help='Only write the metrics')
+    parser.add_argument('--force', action='store_true', help='Run again the scenarios that already have results')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    scenarios = run_config(load_config(args.config), output_dir=args.output, processes=args.processes or None, backend=args.backend,
+                           save_traces=not args.no_traces, force=args.force)
+    logging.info(f"Summary of {len(scenarios)} scenarios saved in {os.path.join(args.output, 'summary.csv')}")
+
+if __name__=="__main__":
+    main()
@@ -5,15 +5,25 @@ Scope: Vehicle Control Problem
 
 Description: This file contains the Simulation class definition which is used to assess the temporal behavior of a vehicle subject to a drag force and a controller.
             It also provides methods for plotting the output and extracting the metrics such as the settling time.
+            Matplotlib (plots) and Numba (compiled backend) are only imported when they are used, so the core imports quickly in every
+            worker process and command line run.
 '''
+import math
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 from modules.vehicle import Vehicle
-from modules.controller import Controller
+from modules.controller import Controller, PID_Discrete_Controller, No_Controller
+from modules.integrators import Integrator
+from modules.instrumentation import Instrumentation
+from modules.metrics import compute_metrics
+from modules.monitoring import Settling_Monitor
+from modules.trace import Trace_Buffer, get_n_steps
+
+OPEN_LOOP_BLOCK = 4096      # Kept samples computed per block by the open-loop fast path, bounds its temporary memory
 
 class Simulation:
     """Definition of the Simulation Class"""
-    def __init__(self,vehicle: Vehicle, controller:Controller, target_velocity:float, dt:float=1, sim_time:float=100, error_thr:float=1):
+    def __init__(self,vehicle: Vehicle, controller:Controller, target_velocity:float, dt:float=1, sim_time:float=100, error_thr:float=1, decimation:int=1, window:float=None, open_loop:str='euler', integrator:Integrator=None, backend:str='python', instrumentation:Instrumentation=None):
         """Definition of the Simulation Class attributes"""
         # Data validation
         if  not  isinstance(controller, Controller):
@@ -24,6 +34,16 @@ class Simulation:
             raise ValueError('dt must be a positive float.')
         if sim_time <= 0 or not isinstance(sim_time,(int,float)):
             raise ValueError('sim_time must be a positive float.')
+        if integrator is not None and not isinstance(integrator, Integrator):
+            raise TypeError('\'integrator\' must be an object of class \'Integrator\'')
+        if backend not in ('python', 'compiled'):
+            raise ValueError('backend must be \'python\' or \'compiled\'.')
+        if backend == 'compiled' and (integrator is not None or type(controller) not in (PID_Discrete_Controller, No_Controller)):
+            raise ValueError('The compiled backend only supports PID_Discrete_Controller and No_Controller with the default Euler integration.')
+        if open_loop not in ('euler', 'exact', None):
+            raise ValueError('open_loop must be \'euler\', \'exact\' or None.')
+        if instrumentation is not None and not isinstance(instrumentation, Instrumentation):
+            raise TypeError('\'instrumentation\' must be an object of class \'Instrumentation\'')
         
         self.vehicle = vehicle          # Vehicle object
         self.controller = controller    # Controller object
@@ -31,60 +51,268 @@ class Simulation:
         self.dt = dt                    # Simulation time step [s]
         self.sim_time = sim_time        # Simulation duration [s]
         self.error_thr = error_thr      # Error threshold [%]
+        self.backend = backend          # 'python' for the step-by-step loop, 'compiled' for the fused kernel of modules.kernels
+        self.integrator = integrator    # Plant integrator between controller samples, None for the explicit Euler step of Vehicle.update
+        self.open_loop = open_loop      # Fast path without controller: 'euler' (same result as the step loop), 'exact' (continuous solution) or None (step loop)
+        self.instrumentation = instrumentation  # Counters, timers, hooks and profiling of the runs, None to disable them
         
-        self.time = []                  # Time vector
-        self.velocity = []              # Velocity vector
-        self.error = []                 # Velocity vector
-
-
-    def plot_velocity(self,label=''):
-        """Used to plot the resulting velocity"""
-        plt.figure(1)
-        plt.plot(self.time, self.velocity,label=label)
-        plt.xlabel('Time [s]')
-        plt.ylabel('Velocity [m/s]')
-        plt.grid(visible=True)
-        plt.legend()
-
-    def plot_error(self,label=''):
-        """Used to plot the resulting velocity error"""
-        plt.figure(2)
-        plt.plot(self.time, self.error,label=label)
-        plt.xlabel('Time [s]')
-        plt.ylabel('Velocity Error [%]')
-        plt.grid(visible=True)        
-        plt.legend()
+        self.n_steps = get_n_steps(sim_time, dt)    # Number of simulation steps
+        self.trace = Trace_Buffer(n_steps=self.n_steps, dt=dt, decimation=decimation, window=window, error_thr=error_thr)  # Preallocated traces and settling state
+        self.stop_reason = None         # Why the last streamed run stopped before sim_time: None, 'settled' or 'diverged'
+        self.initial_velocity = None    # Vehicle velocity at the start of the last run [m/s], None before the first run
+
+    @property
+    def time(self):
+        """Time vector"""
+        return self.trace.get('time')
+
+    @property
+    def velocity(self):
+        """Velocity vector"""
+        return self.trace.get('velocity')
+
+    @property
+    def error(self):
+        """Velocity error vector [%]"""
+        return self.trace.get('error')
+
+    @property
+    def force(self):
+        """Controller output vector"""
+        return self.trace.get('force')
+
+    @staticmethod
+    def _get_axes(figure:int, ax):
+        """Axes to plot on: the given ones or, without explicit axes, those of a global pyplot figure. Plotting modules are imported on first use"""
+        if ax is None:
+            import matplotlib.pyplot as plt
+            ax = plt.figure(figure).gca()
+        from modules import plotting
+        return ax, plotting
+
+    def plot_velocity(self,label='',ax=None):
+        """Used to plot the resulting velocity. Without explicit axes, it draws on the global figure 1"""
+        ax, plotting = self._get_axes(1, ax)
+        plotting.plot_velocity(ax, self.time, self.velocity, label=label)
+
+    def plot_error(self,label='',ax=None):
+        """Used to plot the resulting velocity error. Without explicit axes, it draws on the global figure 2"""
+        ax, plotting = self._get_axes(2, ax)
+        plotting.plot_error(ax, self.time, self.error, label=label)
     
-    def plot_velocity_sp(self):
-        """Used to plot the velocity setpoint. This is not the best implementation, but was faster that handling axes/figures"""
-        plt.figure(1)
-        plt.plot(self.time,[self.target_velocity]*len(self.time),color='magenta',linestyle='--',label=f'Target velocity:{self.target_velocity}m/s')
-        plt.legend()
-
-    def plot_error_band(self):
-        """Used to plot the velocity error band. This is not the best implementation, but was faster that handling axes/figures"""
-        plt.figure(2)
-        plt.plot(self.time, [self.error_thr]*len(self.time),color='red',label=f'$\pm${self.error_thr}% limit')
-        plt.plot(self.time, [-self.error_thr]*len(self.time),color='red')
-        plt.legend()
+    def plot_velocity_sp(self,ax=None):
+        """Used to plot the velocity setpoint. Without explicit axes, it draws on the global figure 1"""
+        ax, plotting = self._get_axes(1, ax)
+        plotting.plot_velocity_sp(ax, self.target_velocity)
+
+    def plot_error_band(self,ax=None):
+        """Used to plot the velocity error band. Without explicit axes, it draws on the global figure 2"""
+        ax, plotting = self._get_axes(2, ax)
+        plotting.plot_error_band(ax, self.error_thr)
 
     def get_settling_time(self):
-        """Used to extract the settling time of the result"""
-        error_outside_th = np.where(np.array(self.error)>self.error_thr)[0] # Calculate elements outside the threshold
-        if len(error_outside_th) == 0 or self.error[-1] > self.error_thr or np.isnan(self.error[-1]):
+        """Used to extract the settling time of the result. It is computed on the kept samples when decimating, and from the state tracked
+        by the trace buffer over the whole run, so it does not depend on the ring window"""
+        if len(self.trace) == 0:
             return -1
-        settling_time = self.time[error_outside_th[-1]]
-        return settling_time
-    
-    def run(self):
-        """Loop that simulates the temporal behavior of the vehicle with the drag force and the controller"""
-        t = 0
-        while t < self.sim_time:
-            self.time.append(t)                                                 # Update timestamp
-            self.velocity.append(self.vehicle.velocity)                         # Update velocity vector using the current vehicle's velocity
-            error = (self.target_velocity - self.vehicle.velocity)              # Absolute error
+        last_error = self.trace.last('error')
+        if self.trace.error_thr == self.error_thr:
+            last_above = self.trace.last_above                                  # Last element outside the threshold
+        elif not self.trace.is_wrapped():                                       # Threshold changed after the run: the kept samples are complete
+            last_outside = self.trace.last_index_above('error', self.error_thr)
+            last_above = None if last_outside == -1 else float(self.trace.sample('time', last_outside))
+        else:
+            raise ValueError('error_thr changed after the run and the ring window dropped samples: the settling time cannot be determined.')
+        if last_above is None or last_error > self.error_thr or np.isnan(last_error):
+            return -1
+        return float(last_above)
+
+    def get_metrics(self, divergence_velocity:float=None, **kwargs) -> np.void:
+        """Response metrics of the result (see modules.metrics.compute_metrics), with the two-sided error band. Computed on the kept samples.
+        When the ring window dropped samples, settled, diverged and settling_time come from the state tracked over the whole run and the
+        metrics that would only describe the kept window are NaN"""
+        metrics = compute_metrics(self.time, self.error, self.force, error_thr=self.error_thr, velocity=self.velocity,
+                                  divergence_velocity=divergence_velocity, **kwargs)
+        trace = self.trace
+        if not trace.is_wrapped():
+            return metrics
+        if trace.error_thr != self.error_thr:
+            raise ValueError('error_thr changed after the run and the ring window dropped samples: the metrics cannot be determined.')
+        diverged = trace.non_finite or (divergence_velocity is not None and trace.max_abs_velocity > divergence_velocity)
+        settled = bool(abs(trace.last('error')) <= self.error_thr) and not diverged
+        for field in ('overshoot', 'rise_time', 'steady_state_error', 'iae', 'ise', 'itae', 'control_effort', 'peak_force'):
+            metrics[field] = np.nan
+        metrics['diverged'] = diverged
+        metrics['settled'] = settled
+        if settled:
+            metrics['settling_time'] = trace.last_outside if trace.last_outside is not None else trace.first_time
+        else:
+            metrics['settling_time'] = np.nan
+        return metrics
+
+    def run(self, hold_time:float=None, divergence_velocity:float=None):
+        """Loop that simulates the temporal behavior of the vehicle with the drag force and the controller.
+        With hold_time or divergence_velocity, the run may stop early (see stream). Early stopping always uses the step-by-step python loop:
+        the open-loop fast path is not used, and it cannot be combined with the compiled backend"""
+        if (hold_time is not None or divergence_velocity is not None) and self.backend == 'compiled':
+            raise ValueError('Early stopping (hold_time, divergence_velocity) is not supported by the compiled backend.')
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._run(hold_time, divergence_velocity)
+        instrumentation.begin_run(self)
+        try:
+            self._run(hold_time, divergence_velocity)
+        finally:
+            instrumentation.end_run(self)
+
+    def _run(self, hold_time:float, divergence_velocity:float):
+        """Dispatches the run to the fastest loop supporting the simulation settings"""
+        if hold_time is not None or divergence_velocity is not None:
+            for _ in self._steps(Settling_Monitor(error_thr=self.error_thr, hold_time=hold_time, divergence_velocity=divergence_velocity)):
+                pass
+            return
+        if self.open_loop is not None and self.integrator is None and isinstance(self.controller, No_Controller):
+            self._start_run()
+            return self._run_fused(self._run_open_loop, controller_calls=0)
+        if self.backend == 'compiled':
+            self._start_run()
+            return self._run_fused(self._run_compiled, controller_calls=0 if isinstance(self.controller, No_Controller) else self.n_steps)
+        if self.integrator is not None or self.instrumentation is not None:     # Shared step loop, see _steps
+            for _ in self._steps():
+                pass
+            return
+        self._start_run()
+        for k in range(self.n_steps):
+            t = k * self.dt                                                     # Timestamp computed from the step count to avoid float drift
+            velocity = self.vehicle.velocity                                    # Current vehicle's velocity
+            error = (self.target_velocity - velocity)                           # Absolute error
             Fc = self.controller.update(error)                                  # Controller's output Fc
-            self.error.append(error/self.target_velocity * 100)                 # Error calculated as percentage
+            self.trace.append(t, velocity, error/self.target_velocity * 100, Fc) # Store the sample (error calculated as percentage)
             self.vehicle.velocity = self.vehicle.update(force=Fc,dt=self.dt)    # Calculate the new vehicle's velocity
 
-            t += self.dt                                                        # Increase a time-step
\ No newline at end of file
+    def _start_run(self):
+        """Clears the trace and the state of the previous run"""
+        self.trace.reset()
+        self.initial_velocity = self.vehicle.velocity
+        self.stop_reason = None
+
+    def _run_fused(self, run_method, controller_calls:int):
+        """Runs a fused path (open loop or compiled kernel). With instrumentation, it is counted and timed as a whole"""
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return run_method()
+        start = time.perf_counter() if instrumentation.timers else None
+        run_method()
+        fused = time.perf_counter() - start if start is not None else 0.0
+        instrumentation.count(steps=self.n_steps, controller_calls=controller_calls, plant_evaluations=self.n_steps, fused=fused)
+
+    def _run_open_loop(self):
+        """Fast path for the vehicle without controller: the trajectory is computed in blocks, and only at the samples kept by the trace
+        decimation, so the memory does not grow with the number of steps"""
+        decimation = self.trace.decimation
+        block = OPEN_LOOP_BLOCK * decimation                                    # Steps per block, each block starts at a kept sample
+        for start in range(0, self.n_steps, block):
+            n = min(block, self.n_steps - start)
+            velocity = self.vehicle.get_open_loop_velocity(n_steps=n, dt=self.dt, method=self.open_loop, decimation=decimation)
+            error = (self.target_velocity - velocity[:-1])/self.target_velocity * 100
+            self.trace.extend(np.arange(start, start + n, decimation) * self.dt, velocity[:-1], error, 0.0, offered=n)
+            self.vehicle.velocity = velocity[-1]
+
+    def _run_compiled(self):
+        """Runs the whole simulation in the fused kernel, which writes directly in the trace buffer and returns the final states"""
+        from modules.kernels import closed_loop_kernel     # Imports (and compiles) Numba on first use
+        controller = self.controller
+        has_controller = isinstance(controller, PID_Discrete_Controller)
+        if has_controller:
+            gains = (float(controller.kp), float(controller.ki), float(controller.kd), float(controller.Ts))
+            state = (float(controller.error_int), 0.0 if controller.error_prev is None else float(controller.error_prev), controller.error_prev is not None)
+        else:
+            gains, state = (0.0, 0.0, 0.0, 1.0), (0.0, 0.0, False)
+        trace = self.trace
+        track = trace.error_thr is not None
+        nan = float('nan')
+        velocity, error_int, error_prev, has_error_prev, written, *tracked = closed_loop_kernel(
+            float(self.vehicle.velocity), float(self.vehicle.mass), float(self.vehicle.k_kgpm), float(self.target_velocity), has_controller, *gains, *state,
+            float(self.dt), self.n_steps, trace.storage(), trace.decimation, 0, float(trace.error_thr) if track else nan, nan, nan, nan, False, 0.0)
+        if track:
+            tracked = dict(zip(trace.TRACKED, tracked))
+            for name in ('first_time', 'last_above', 'last_outside'):      # NaN is used by the kernel for missing samples
+                tracked[name] = None if math.isnan(tracked[name]) else tracked[name]
+            trace.commit(offered=self.n_steps, written=written, tracked=tracked)
+        else:
+            trace.commit(offered=self.n_steps, written=written)
+        self.vehicle.velocity = velocity
+        if has_controller:
+            controller.error_int = error_int
+            controller.error_prev = error_prev if has_error_prev else None
+
+    def stream(self, chunk_size:int=None, hold_time:float=None, divergence_velocity:float=None):
+        """Generator that simulates step by step and yields (t, velocity, error [%], Fc) for every step, or a tuple of arrays with up to
+        chunk_size samples each when chunk_size is given. Samples are also stored in the trace buffer.
+        The run stops early once the error has stayed within +-error_thr for hold_time seconds, or once the velocity is not finite or
+        exceeds divergence_velocity in absolute value. The reason is stored in self.stop_reason"""
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return (yield from self._stream(chunk_size, hold_time, divergence_velocity))
+        instrumentation.begin_run(self)
+        try:
+            yield from self._stream(chunk_size, hold_time, divergence_velocity)
+        finally:
+            instrumentation.end_run(self)
+
+    def _stream(self, chunk_size:int, hold_time:float, divergence_velocity:float):
+        """Generator behind stream: groups the samples of the step loop in chunks"""
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer.')
+        steps = self._steps(Settling_Monitor(error_thr=self.error_thr, hold_time=hold_time, divergence_velocity=divergence_velocity))
+        if chunk_size is None:
+            return (yield from steps)
+        chunk = np.empty((4, chunk_size))
+        n = 0
+        for sample in steps:
+            chunk[:, n] = sample
+            n += 1
+            if n == chunk_size:
+                yield tuple(chunk.copy())
+                n = 0
+        if n:
+            yield tuple(chunk[:, :n].copy())
+
+    def _steps(self, monitor:Settling_Monitor=None):
+        """Step-by-step loop shared by stream and by the runs that the fast loop of _run does not cover (integrator, instrumentation, early
+        stop). Yields (t, velocity, error [%], Fc) after every step. With a monitor, it stops once the monitor reports settling or divergence"""
+        self._start_run()
+        integrator = self.integrator
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            step_hooks = instrumentation.hooks['step']
+            clock = time.perf_counter if instrumentation.timers else (lambda: 0.0)
+        for k in range(self.n_steps):
+            t = k * self.dt
+            velocity = self.vehicle.velocity
+            error = (self.target_velocity - velocity)
+            if instrumentation is not None:
+                t0 = clock()
+            Fc = self.controller.update(error)
+            if instrumentation is not None:
+                controller_time = clock() - t0
+            error = error/self.target_velocity * 100
+            self.trace.append(t, velocity, error, Fc)
+            if instrumentation is not None:
+                t0 = clock()
+            if integrator is None:
+                self.vehicle.velocity = self.vehicle.update(force=Fc,dt=self.dt)
+            else:
+                evaluations = integrator.n_evaluations
+                self.vehicle.velocity = integrator.integrate(lambda v: self.vehicle.get_acceleration(Fc, v), velocity, self.dt)
+            if instrumentation is not None:         # Counted at every step, the consumer may stop the generator at any time
+                plant_time = clock() - t0
+                evaluations = integrator.n_evaluations - evaluations if integrator is not None else 1
+                instrumentation.count(steps=1, controller_calls=1, plant_evaluations=evaluations, controller=controller_time, plant=plant_time)
+                for callback in step_hooks:
+                    callback(self, k, t, velocity, error, Fc)
+            if monitor is not None:
+                self.stop_reason = monitor.update(t, velocity, error)
+            yield t, velocity, error, Fc
+            if self.stop_reason is not None:
+                break
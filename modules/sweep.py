@@ -0,0 +1,118 @@
+'''
+Title: sweep
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the tools used to run parameter sweeps (e.g. the robustness analysis) over a grid of initial velocities,
+            masses, drag constants, target velocities and PID gains. Every grid point is simulated with a fresh Vehicle,
+            PID_Discrete_Controller and Simulation, and the points are distributed in chunks over a process pool.
+'''
+import os
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+from modules.simulation import Simulation
+from modules.trace_store import Trace_Writer
+from modules.instrumentation import Instrumentation
+from modules.result_cache import Result_Cache
+
+SWEEP_FIELDS = ('initial_velocity', 'mass', 'k_kgpm', 'target_velocity', 'kp', 'ki', 'kd')   # Parameters that can be swept
+SWEEP_DEFAULTS = {'initial_velocity':10, 'mass':1, 'k_kgpm':0.05, 'target_velocity':5, 'kp':0.28, 'ki':0.12, 'kd':0.05}
+GRID_DTYPE = np.dtype([(field, np.float64) for field in SWEEP_FIELDS])
+RESULT_DTYPE = np.dtype(GRID_DTYPE.descr + [('settling_time', np.float64)])
+
+def make_grid(**axes) -> np.ndarray:
+    """Builds the cartesian product of the given axes as a structured array. Parameters not given take the value in SWEEP_DEFAULTS"""
+    unknown = set(axes) - set(SWEEP_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown sweep parameters: {sorted(unknown)}')
+    values = [np.atleast_1d(axes.get(field, SWEEP_DEFAULTS[field])) for field in SWEEP_FIELDS]
+    grid = np.empty(int(np.prod([len(v) for v in values])), dtype=GRID_DTYPE)
+    for i, point in enumerate(itertools.product(*values)):
+        grid[i] = point
+    return grid
+
+def build_point(point, Ts:float=1, dt:float=1, sim_time:float=100, error_thr:float=1, instrumentation:Instrumentation=None) -> Simulation:
+    """Builds the Vehicle, controller and Simulation of a single grid point"""
+    vehicle = Vehicle(mass=point['mass'], initial_velocity=point['initial_velocity'], k_kgpm=point['k_kgpm'])
+    controller = PID_Discrete_Controller(kp=point['kp'], ki=point['ki'], kd=point['kd'], Ts=Ts)
+    return Simulation(vehicle=vehicle, controller=controller, target_velocity=point['target_velocity'], dt=dt, sim_time=sim_time, error_thr=error_thr, instrumentation=instrumentation)
+
+def simulate_point(point, Ts:float=1, dt:float=1, sim_time:float=100, error_thr:float=1, instrumentation:Instrumentation=None) -> Simulation:
+    """Simulates a single grid point with its own Vehicle, controller and Simulation and returns the Simulation"""
+    simEnv = build_point(point, Ts=Ts, dt=dt, sim_time=sim_time, error_thr=error_thr, instrumentation=instrumentation)
+    with np.errstate(over='ignore', invalid='ignore'):     # Unstable points diverge, they are reported with a -1 settling time
+        simEnv.run()
+    return simEnv
+
+def run_point(point, Ts:float=1, dt:float=1, sim_time:float=100, error_thr:float=1) -> float:
+    """Simulates a single grid point and returns its settling time"""
+    return simulate_point(point, Ts=Ts, dt=dt, sim_time=sim_time, error_thr=error_thr).get_settling_time()
+
+def _run_chunk(args):
+    """Worker entry point: simulates a chunk of grid points. Returns the settling times, the traces of every point (if requested) and
+    the snapshot of the chunk instrumentation (None without instrumentation). Points found in the cache are not simulated"""
+    chunk, settings, return_traces, instrumentation, cache = args
+    settling_time = np.empty(len(chunk), dtype=np.float64)
+    traces = []
+    for i, point in enumerate(chunk):
+        if cache is None:
+            simEnv = simulate_point(point, **settings, instrumentation=instrumentation)
+            settling_time[i] = simEnv.get_settling_time()
+        else:
+            simEnv = build_point(point, **settings, instrumentation=instrumentation)
+            with np.errstate(over='ignore', invalid='ignore'):
+                settling_time[i] = cache.run(simEnv, traces=return_traces)
+        if return_traces:
+            traces.append({'time':simEnv.time, 'velocity':simEnv.velocity, 'error':simEnv.error, 'force':simEnv.force})
+    return settling_time, traces, instrumentation.snapshot() if instrumentation is not None else None
+
+def run_sweep(grid:np.ndarray, Ts:float=1, dt:float=1, sim_time:float=100, error_thr:float=1, processes:int=None, chunksize:int=None, trace_store:str=None,
+              instrumentation:Instrumentation=None, cache:Result_Cache=None) -> np.ndarray:
+    """Simulates every point of the grid and returns a structured array with the grid parameters and the settling time of each point.
+    processes=1 runs serially in the calling process, None uses all the available cores.
+    If trace_store is given, the traces and metadata of every run are appended to that Trace_Writer directory as the chunks finish.
+    If instrumentation is given, every chunk is instrumented with its own copy and the counters, timers and profiles are merged into it
+    (the hooks are only called when running serially). If cache is given, the points already in the Result_Cache are not simulated and
+    the new ones are stored in it"""
+    grid = np.asarray(grid, dtype=GRID_DTYPE)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes < 1:
+        raise ValueError('processes must be a positive integer.')
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(len(grid) / (4 * processes))))    # A few chunks per worker to balance the load
+    settings = {'Ts':Ts, 'dt':dt, 'sim_time':sim_time, 'error_thr':error_thr}
+    serial = processes == 1 or len(grid) <= chunksize
+    chunks = [(grid[i:i + chunksize], settings, trace_store is not None, instrumentation.spawn(hooks=serial) if instrumentation is not None else None, cache)
+              for i in range(0, len(grid), chunksize)]
+
+    writer = Trace_Writer(trace_store) if trace_store is not None else None
+    settling_time = []
+    def collect(chunk, result):
+        """Keeps the settling times of a finished chunk and streams its traces to the store"""
+        settling_time.append(result[0])
+        if instrumentation is not None:
+            instrumentation.merge(result[2])
+        if writer is not None:
+            for point, ts, traces in zip(chunk[0], *result[:2]):
+                writer.append_arrays(**traces, **{field:point[field] for field in SWEEP_FIELDS}, Ts=Ts, dt=dt, sim_time=sim_time, error_thr=error_thr, settling_time=ts)
+    try:
+        if serial:
+            for chunk in chunks:
+                collect(chunk, _run_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as executor:
+                for chunk, result in zip(chunks, executor.map(_run_chunk, chunks)):
+                    collect(chunk, result)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    results = np.empty(len(grid), dtype=RESULT_DTYPE)
+    for field in SWEEP_FIELDS:
+        results[field] = grid[field]
+    results['settling_time'] = np.concatenate(settling_time) if settling_time else []
+    return results
@@ -0,0 +1,188 @@
+'''
+Title: trace
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Trace_Buffer class, a preallocated storage for the time, velocity, error and controller output traces
+            produced by a simulation. The buffer is sized up front from sim_time/dt and can optionally keep only every k-th sample
+            (decimation) and/or only the last W seconds of the run (ring buffer).
+            When an error threshold is given, the buffer also tracks the last stored samples outside the error band, so the settling
+            time does not depend on how much history the ring keeps.
+'''
+import math
+import numpy as np
+
+def get_n_steps(sim_time:float, dt:float) -> int:
+    """Number of simulation steps needed to cover sim_time with a time step dt. The division is rounded to absorb float error, e.g. 1/0.1"""
+    return int(np.ceil(round(sim_time / dt, 9)))
+
+class Trace_Buffer:
+    """Preallocated, array-backed storage of simulation traces"""
+    FIELDS = ('time', 'velocity', 'error', 'force')
+    TRACKED = ('first_time', 'last_above', 'last_outside', 'non_finite', 'max_abs_velocity')   # State tracked over the whole run
+
+    def __init__(self, n_steps:int, dt:float=1, decimation:int=1, window:float=None, error_thr:float=None):
+        """Allocates one contiguous float64 row per field"""
+        # Data validation
+        if not isinstance(decimation, (int, np.integer)) or decimation < 1:
+            raise ValueError('decimation must be a positive integer.')
+        if window is not None and window <= 0:
+            raise ValueError('window must be a positive float.')
+
+        self.n_steps = n_steps          # Number of samples offered by the simulation
+        self.dt = dt                    # Time between offered samples [s]
+        self.decimation = decimation    # Keep every k-th sample
+        self.window = window            # Keep only the last W seconds [s], None to keep the full run
+        self.error_thr = error_thr      # Error threshold [%] tracked over every stored sample, None to not track it
+
+        capacity = -(-n_steps // decimation)
+        if window is not None:
+            capacity = min(capacity, max(1, int(np.ceil(round(window / (dt * decimation), 9)))))
+        self.capacity = capacity
+        self._data = np.empty((len(self.FIELDS), capacity))    # Rows: time, velocity, error, force
+        self.reset()
+
+    def reset(self):
+        """Discards the stored samples without releasing memory"""
+        self._offered = 0   # Samples offered to the buffer (before decimation)
+        self._written = 0   # Samples written to the buffer (after decimation)
+        self._reset_tracking()
+
+    def _reset_tracking(self):
+        """Clears the settling and divergence state tracked over the stored samples"""
+        self.first_time = None          # Time of the first stored sample
+        self.last_above = None          # Time of the last stored sample with error > error_thr (one-sided), None if there is none
+        self.last_outside = None        # Time of the last stored sample with |error| > error_thr or not finite (two-sided), None if there is none
+        self.non_finite = False         # True if a stored sample was not finite
+        self.max_abs_velocity = 0.0     # Largest stored absolute velocity [m/s]
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def written(self) -> int:
+        """Samples written after decimation, including those dropped by the ring"""
+        return self._written
+
+    def append(self, t:float, velocity:float, error:float, force:float):
+        """Stores one sample, honoring decimation and the ring window"""
+        offered = self._offered
+        self._offered = offered + 1
+        if offered % self.decimation:
+            return
+        i = self._written % self.capacity
+        data = self._data
+        data[0, i] = t
+        data[1, i] = velocity
+        data[2, i] = error
+        data[3, i] = force
+        self._written += 1
+        if self.error_thr is not None:
+            self._track(t, velocity, error, force)
+
+    def _track(self, t:float, velocity:float, error:float, force:float):
+        """Updates the tracked settling and divergence state with one stored sample"""
+        if self.first_time is None:
+            self.first_time = t
+        if error > self.error_thr:
+            self.last_above = t
+        if not abs(error) <= self.error_thr:    # NaN samples count as outside
+            self.last_outside = t
+        if not (math.isfinite(velocity) and math.isfinite(error) and math.isfinite(force)):
+            self.non_finite = True
+        elif abs(velocity) > self.max_abs_velocity:
+            self.max_abs_velocity = abs(velocity)
+
+    def _track_block(self, block:np.ndarray):
+        """Updates the tracked settling and divergence state with a (4 x n) block of stored samples"""
+        if block.shape[1] == 0:
+            return
+        t, velocity, error, force = block
+        if self.first_time is None:
+            self.first_time = float(t[0])
+        with np.errstate(invalid='ignore'):
+            above = np.flatnonzero(error > self.error_thr)
+            outside = np.flatnonzero(~(np.abs(error) <= self.error_thr))
+        if len(above):
+            self.last_above = float(t[above[-1]])
+        if len(outside):
+            self.last_outside = float(t[outside[-1]])
+        finite = np.isfinite(block).all(axis=0)
+        self.non_finite = self.non_finite or not finite.all()
+        if finite.any():
+            self.max_abs_velocity = max(self.max_abs_velocity, float(np.max(np.abs(velocity[finite]))))
+
+    def extend(self, t, velocity, error, force, offered:int=None):
+        """Stores a block of consecutive samples given as arrays. With offered, the block is already decimated: it holds the samples kept
+        out of offered consecutive samples, the first one being kept (the buffer must be at a kept sample)"""
+        t, velocity, error, force = np.broadcast_arrays(t, velocity, error, force)
+        if offered is None:
+            offered = t.shape[0]
+            first = (-self._offered) % self.decimation             # First sample of the block kept by the decimation
+            t, velocity, error, force = (x[first::self.decimation] for x in (t, velocity, error, force))
+        elif self._offered % self.decimation or t.shape[0] != -(-offered // self.decimation):
+            raise ValueError('The decimated block does not match the samples kept by the buffer.')
+        block = np.stack((t, velocity, error, force))              # Only the kept samples are copied
+        self._offered += offered
+        if self.error_thr is not None:
+            self._track_block(block)
+        if block.shape[1] > self.capacity:                         # Only the last samples fit in the ring
+            self._written += block.shape[1] - self.capacity
+            block = block[:, -self.capacity:]
+        i = self._written % self.capacity
+        n_first = min(block.shape[1], self.capacity - i)           # Samples written before wrapping around the ring
+        self._data[:, i:i + n_first] = block[:, :n_first]
+        self._data[:, :block.shape[1] - n_first] = block[:, n_first:]
+        self._written += block.shape[1]
+
+    def storage(self) -> np.ndarray:
+        """Underlying (4 x capacity) ring storage, for kernels that write the samples directly. They must call commit afterwards"""
+        return self._data
+
+    def commit(self, offered:int, written:int, tracked:dict=None):
+        """Sets the sample counters after a kernel wrote directly in the storage (offered: before decimation, written: after it).
+        tracked gives the settling and divergence state tracked by the kernel (see TRACKED), without it the state is computed from the
+        stored samples"""
+        self._offered = offered
+        self._written = written
+        self._reset_tracking()
+        if tracked is not None:
+            for name in self.TRACKED:
+                setattr(self, name, tracked[name])
+        elif self.error_thr is not None:
+            self._track_block(np.stack([self.get(field) for field in self.FIELDS]))
+
+    def is_wrapped(self):
+        """True when the ring buffer has overwritten its oldest samples"""
+        return self._written > self.capacity
+
+    def _start(self):
+        """Physical index of the oldest stored sample"""
+        return self._written % self.capacity if self.is_wrapped() else 0
+
+    def get(self, field:str) -> np.ndarray:
+        """Returns the field in chronological order. This is a view of the buffer unless the ring has wrapped"""
+        row = self._data[self.FIELDS.index(field)]
+        if not self.is_wrapped():
+            return row[:self._written]
+        start = self._start()
+        return np.concatenate((row[start:], row[:start]))
+
+    def last(self, field:str) -> float:
+        """Returns the most recent sample of a field"""
+        if self._written == 0:
+            raise IndexError('The trace buffer is empty.')
+        return self._data[self.FIELDS.index(field), (self._written - 1) % self.capacity]
+
+    def sample(self, field:str, index:int) -> float:
+        """Returns the sample of a field at a chronological index"""
+        return self._data[self.FIELDS.index(field), (self._start() + index) % self.capacity]
+
+    def last_index_above(self, field:str, threshold:float) -> int:
+        """Chronological index of the last kept sample above the threshold, -1 if there is none. Computed in place, without reordering the ring.
+        Samples dropped by the ring are not considered, see last_above for the state tracked over the whole run"""
+        row = self._data[self.FIELDS.index(field), :len(self)]
+        above = np.flatnonzero(row > threshold)
+        if len(above) == 0:
+            return -1
+        return int(np.max((above - self._start()) % self.capacity))
@@ -0,0 +1,120 @@
+'''
+Title: trace_store
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the Trace_Writer and Trace_Store classes, used to persist the traces of many simulation runs in a compact
+            columnar binary format and to read them back through memory-mapping. A store is a directory with:
+    - time.f64, velocity.f64, error.f64, force.f64: raw float64 columns with the samples of all the runs, one after the other.
+    - runs.bin: one fixed-size record per run (RUN_DTYPE) with its offset and length in the columns and its metadata.
+    - meta.json: format description.
+    Runs are appended as they finish. The columns are written before the run record, so readers never see a run with incomplete data.
+'''
+import os
+import json
+import numpy as np
+
+COLUMNS = ('time', 'velocity', 'error', 'force')
+RUN_DTYPE = np.dtype([('offset', np.int64), ('length', np.int64), ('mass', np.float64), ('k_kgpm', np.float64), ('initial_velocity', np.float64),
+                      ('target_velocity', np.float64), ('kp', np.float64), ('ki', np.float64), ('kd', np.float64), ('Ts', np.float64),
+                      ('dt', np.float64), ('sim_time', np.float64), ('error_thr', np.float64), ('settling_time', np.float64)])
+METADATA_FIELDS = RUN_DTYPE.names[2:]
+FORMAT_VERSION = 1
+
+def get_metadata(simulation) -> dict:
+    """Run metadata of a Simulation that has been run. Gains are NaN for controllers without them, and the initial velocity is the velocity
+    at the start of the run (not the first stored sample, which is later when a ring window dropped samples)"""
+    controller = simulation.controller
+    initial_velocity = np.nan if simulation.initial_velocity is None else simulation.initial_velocity
+    return {'mass':simulation.vehicle.mass, 'k_kgpm':simulation.vehicle.k_kgpm, 'initial_velocity':initial_velocity,
+            'target_velocity':simulation.target_velocity, 'kp':getattr(controller, 'kp', np.nan), 'ki':getattr(controller, 'ki', np.nan),
+            'kd':getattr(controller, 'kd', np.nan), 'Ts':getattr(controller, 'Ts', np.nan), 'dt':simulation.dt, 'sim_time':simulation.sim_time,
+            'error_thr':simulation.error_thr, 'settling_time':simulation.get_settling_time()}
+
+class Trace_Writer:
+    """Appends runs to a trace store, one run at a time"""
+    def __init__(self, path:str):
+        """Creates the store directory if needed, or opens an existing store to append runs to it"""
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f)['version'] != FORMAT_VERSION:
+                    raise ValueError(f'{path} was written with an incompatible format version.')
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'version':FORMAT_VERSION, 'columns':list(COLUMNS), 'dtype':'<f8', 'runs_dtype':RUN_DTYPE.descr}, f, indent=2)
+        self._columns = {column:open(os.path.join(path, f'{column}.f64'), 'ab') for column in COLUMNS}
+        self._runs = open(os.path.join(path, 'runs.bin'), 'ab')
+        sizes = {column:f.tell() // 8 for column, f in self._columns.items()}
+        self._offset = max(sizes.values())                                      # Samples already in the store
+        for column, size in sizes.items():  # Columns left unaligned by an interrupted writer are padded, their samples belong to no run
+            self._columns[column].write(np.full(self._offset - size, np.nan, dtype='<f8').tobytes())
+
+    def append_arrays(self, time, velocity, error, force, **metadata):
+        """Appends one run given its traces and metadata (see METADATA_FIELDS, missing fields are stored as NaN)"""
+        unknown = set(metadata) - set(METADATA_FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown metadata fields: {sorted(unknown)}')
+        data = dict(zip(COLUMNS, np.broadcast_arrays(*(np.asarray(x, dtype='<f8') for x in (time, velocity, error, force)))))
+        length = len(data['time'])
+        for column in COLUMNS:
+            self._columns[column].write(np.ascontiguousarray(data[column]).tobytes())
+            self._columns[column].flush()
+        record = np.zeros(1, dtype=RUN_DTYPE)
+        record['offset'], record['length'] = self._offset, length
+        for field in METADATA_FIELDS:
+            record[field] = metadata.get(field, np.nan)
+        self._runs.write(record.tobytes())
+        self._runs.flush()
+        self._offset += length
+
+    def append(self, simulation):
+        """Appends the traces and metadata of a Simulation that has been run"""
+        self.append_arrays(simulation.time, simulation.velocity, simulation.error, simulation.force, **get_metadata(simulation))
+
+    def close(self):
+        for f in (*self._columns.values(), self._runs):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Trace_Store:
+    """Memory-mapped reader of a trace store. Only the pages of the accessed runs/columns are loaded"""
+    def __init__(self, path:str):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError(f'{path} was written with an incompatible format version.')
+        self.path = path
+        runs_path = os.path.join(path, 'runs.bin')
+        n_runs = os.path.getsize(runs_path) // RUN_DTYPE.itemsize
+        self.runs = np.memmap(runs_path, dtype=RUN_DTYPE, mode='r', shape=(n_runs,)) if n_runs else np.empty(0, dtype=RUN_DTYPE)   # Run records
+        n_samples = int(self.runs['offset'][-1] + self.runs['length'][-1]) if n_runs else 0
+        self._columns = {column:np.memmap(os.path.join(path, f'{column}.f64'), dtype='<f8', mode='r', shape=(n_samples,)) if n_samples else np.empty(0)
+                         for column in COLUMNS}
+
+    def __len__(self):
+        return len(self.runs)
+
+    def column(self, column:str) -> np.ndarray:
+        """Memory-mapped column with the samples of all the runs"""
+        if column not in COLUMNS:
+            raise KeyError(f'Unknown column {column!r}, available: {COLUMNS}')
+        return self._columns[column]
+
+    def get(self, run:int, column:str) -> np.ndarray:
+        """Memory-mapped trace of one column of one run"""
+        offset, length = int(self.runs['offset'][run]), int(self.runs['length'][run])
+        return self.column(column)[offset:offset + length]
+
+    def get_run(self, run:int) -> dict:
+        """Traces and metadata of one run"""
+        result = {column:self.get(run, column) for column in COLUMNS}
+        result.update({field:float(self.runs[field][run]) for field in METADATA_FIELDS})
+        return result
@@ -0,0 +1,177 @@
+'''
+Title: tuning
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the PID_Tuner class, used to compute the PID gains of a vehicle automatically:
+    1. The ultimate gain Ku and the oscillation period Tu are found by simulating batches of P-only controllers.
+    2. Ziegler-Nichols rules give the initial gains.
+    3. The gains are refined with a Nelder-Mead (derivative-free) optimizer against a cost combining the settling time (two-sided band),
+       the overshoot and the control effort (see modules.metrics).
+    All candidate gains are evaluated in batches with Batch_Simulation, and costs of previously evaluated (vehicle, gains) points are cached.
+'''
+import numpy as np
+from modules.batch_simulation import Batch_Simulation
+
+class PID_Tuner:
+    """Automatic tuning of PID_Discrete_Controller gains for a vehicle"""
+    def __init__(self, mass:float, initial_velocity, k_kgpm:float, target_velocity:float, Ts:float=1, sim_time:float=50, error_thr:float=1,
+                 overshoot_weight:float=0.1, effort_weight:float=0.01, cache:dict=None):
+        """Definition of the tuning scenario. initial_velocity may be an array, the cost is then averaged over all the initial velocities"""
+        if mass <= 0:
+            raise ValueError("Mass must be positive.")
+        if k_kgpm < 0:
+            raise ValueError("k_kgpm cannot be negative.")
+        self.mass = mass                                                    # Vehicle mass [kg]
+        self.initial_velocity = np.atleast_1d(np.asarray(initial_velocity, dtype=np.float64))  # Initial velocities [m/s]
+        self.k_kgpm = k_kgpm                                                # Drag force constant [kg/m]
+        self.target_velocity = target_velocity                              # Velocity setpoint [m/s]
+        self.Ts = Ts                                                        # Controller sampling time, also used as simulation time step [s]
+        self.sim_time = sim_time                                            # Simulation duration [s]
+        self.error_thr = error_thr                                          # Error threshold [%]
+        self.overshoot_weight = overshoot_weight                            # Cost weight of the overshoot [1/%]
+        self.effort_weight = effort_weight                                  # Cost weight of the mean squared controller output [1/N^2]
+        self.cache = {} if cache is None else cache                         # Costs of previously evaluated points, may be shared between tuners
+        self.n_evaluations = 0                                              # Number of simulated (not cached) gain sets
+
+    def _key(self, gains):
+        """Cache key of a (vehicle, gains) point"""
+        return (self.mass, tuple(self.initial_velocity), self.k_kgpm, self.target_velocity, self.Ts, self.sim_time, self.error_thr,
+                self.overshoot_weight, self.effort_weight, *(float(g) for g in gains))
+
+    def _simulate(self, kp, ki, kd, initial_velocity=None):
+        """Simulates every gain set for every initial velocity in a single batch. Returns the batch with shape (gains x initial velocities)"""
+        initial_velocity = self.initial_velocity if initial_velocity is None else np.atleast_1d(initial_velocity)
+        n_v = len(initial_velocity)
+        batch = Batch_Simulation(mass=self.mass, initial_velocity=np.tile(initial_velocity, len(kp)), k_kgpm=self.k_kgpm,
+                                 kp=np.repeat(kp, n_v), ki=np.repeat(ki, n_v), kd=np.repeat(kd, n_v), Ts=self.Ts,
+                                 target_velocity=self.target_velocity, dt=self.Ts, sim_time=self.sim_time, error_thr=self.error_thr)
+        return batch.run()
+
+    def cost(self, batch):
+        """Cost of every run of a batch: settling time [s] + weighted overshoot [%] + weighted control effort. Unsettled runs cost sim_time"""
+        metrics = batch.get_metrics()
+        settling_time = np.where(metrics['settled'], metrics['settling_time'], self.sim_time)
+        effort = metrics['control_effort'] / (batch.error.shape[1] * self.Ts)     # Mean squared controller output
+        with np.errstate(invalid='ignore'):
+            cost = settling_time + self.overshoot_weight * metrics['overshoot'] + self.effort_weight * effort
+        return np.where(np.isfinite(cost), cost, np.inf)                    # Diverging runs are never selected
+
+    def evaluate(self, gains) -> np.ndarray:
+        """Returns the cost of each (kp, ki, kd) row of gains. Only the rows missing from the cache are simulated, in a single batch"""
+        gains = np.atleast_2d(np.asarray(gains, dtype=np.float64))
+        keys = [self._key(g) for g in gains]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.cache))
+        if missing:
+            new_gains = np.array([key[-3:] for key in missing])
+            with np.errstate(over='ignore', invalid='ignore'):
+                batch = self._simulate(new_gains[:, 0], new_gains[:, 1], new_gains[:, 2])
+                cost = self.cost(batch).reshape(len(missing), len(self.initial_velocity)).mean(axis=1)
+            self.cache.update(zip(missing, cost))
+            self.n_evaluations += len(missing)
+        return np.array([self.cache[key] for key in keys])
+
+    def _is_oscillating(self, error):
+        """Classifies P-only responses: True if the response oscillates in the second half of the run without decaying (or the run diverged)"""
+        n = error.shape[1]
+        tail = error[:, n // 2:]
+        with np.errstate(invalid='ignore'):
+            tail = tail - np.mean(tail, axis=1, keepdims=True)              # Remove the steady-state error of the P controller
+            q = tail.shape[1] // 2
+            amplitude_early = np.max(np.abs(tail[:, :q]), axis=1)
+            amplitude_late = np.max(np.abs(tail[:, q:]), axis=1)
+            n_crossings = np.count_nonzero(np.diff(np.signbit(tail), axis=1), axis=1)   # Slow monotonic responses have (almost) no crossings
+            sustained = (amplitude_late >= 0.95 * amplitude_early) & (amplitude_late > 1e-6 * abs(self.target_velocity)) & (n_crossings >= 4)
+        return sustained | ~np.all(np.isfinite(error), axis=1)
+
+    def find_ultimate_gain(self, kp_max:float=None, n_candidates:int=32, iterations:int=4):
+        """Finds the ultimate gain Ku (smallest proportional gain with a sustained oscillation) and its oscillation period Tu [s].
+        Each iteration simulates n_candidates P-only controllers in one batch and narrows the interval containing Ku.
+        The experiment starts from the initial velocity closest to the target, as large initial errors make the loop diverge before Ku"""
+        v0 = self.initial_velocity[np.argmin(np.abs(self.initial_velocity - self.target_velocity))]
+        if kp_max is None:
+            kp_max = 4 * self.mass / self.Ts    # The Euler loop is unstable for (kp + drag slope) * Ts / mass > 2, so Ku is below this bound
+        kp_low, kp_high = 0, kp_max
+        for _ in range(iterations):
+            kp = np.linspace(kp_low, kp_high, n_candidates)
+            with np.errstate(over='ignore', invalid='ignore'):
+                batch = self._simulate(kp, np.zeros(n_candidates), np.zeros(n_candidates), initial_velocity=v0)
+            oscillating = self._is_oscillating(batch.error)
+            if not oscillating.any():
+                raise RuntimeError(f'No sustained oscillation found for kp <= {kp_high}, increase kp_max.')
+            i = int(np.argmax(oscillating))
+            if i == 0:
+                kp_low, kp_high = kp[0], kp[0]
+                break
+            kp_low, kp_high = kp[i - 1], kp[i]
+        ku = kp_high
+
+        # Oscillation period measured from the zero crossings of the response at Ku
+        with np.errstate(over='ignore', invalid='ignore'):
+            batch = self._simulate(np.array([ku]), np.zeros(1), np.zeros(1), initial_velocity=v0)
+        error = batch.error[0][np.isfinite(batch.error[0])]             # Only the samples before a divergence
+        tail = error[len(error) // 2:]
+        tail = tail - np.mean(tail)
+        crossings = np.flatnonzero(np.diff(np.signbit(tail)))
+        if len(crossings) < 2:
+            raise RuntimeError('The oscillation period could not be measured, increase sim_time.')
+        tu = 2 * np.mean(np.diff(crossings)) * self.Ts
+        return float(ku), float(tu)
+
+    def ziegler_nichols(self, ku:float, tu:float, mode:str='PID'):
+        """Ziegler-Nichols gains. The integral gain is multiplied by Ts because PID_Discrete_Controller accumulates the error without it"""
+        if mode == "PI":
+            return 0.45*ku, 0.54*ku/tu*self.Ts, 0
+        elif mode == "PID":
+            return 0.6*ku, 1.2*ku/tu*self.Ts, 0.075*ku*tu
+        raise ValueError('mode must be "PI" or "PID".')
+
+    def optimize(self, initial_gains, mode:str='PID', max_iter:int=200, tol:float=1e-3, step:float=0.1):
+        """Refines the gains with a Nelder-Mead simplex. The candidate points of each iteration (reflection, expansion and both contractions)
+        are evaluated together in one batch. Gains are kept non-negative, and kd is fixed to 0 in "PI" mode"""
+        n_free = 3 if mode == "PID" else 2
+        def to_gains(x):
+            x = np.clip(np.atleast_2d(x), 0, None)
+            return np.column_stack((x, np.zeros((len(x), 3 - n_free)))) if n_free < 3 else x
+
+        x0 = np.clip(np.asarray(initial_gains, dtype=np.float64)[:n_free], 0, None)
+        for _ in range(10):     # Aggressive initial gains may be unstable: they are scaled down until the closed loop is stable
+            if np.isfinite(self.evaluate(to_gains(x0))[0]):
+                break
+            x0 = 0.5 * x0
+        simplex = np.vstack((x0, x0 + np.diag(np.where(x0 != 0, step * np.abs(x0), step))))
+        simplex = np.clip(simplex, 0, None)
+        cost = self.evaluate(to_gains(simplex))
+        for _ in range(max_iter):
+            order = np.argsort(cost)
+            simplex, cost = simplex[order], cost[order]
+            if np.isfinite(cost[0]) and cost[-1] - cost[0] <= tol and np.max(np.abs(simplex - simplex[0])) <= tol:
+                break
+            centroid = np.mean(simplex[:-1], axis=0)
+            worst = simplex[-1]
+            candidates = np.clip(np.array([centroid + (centroid - worst),        # Reflection
+                                           centroid + 2 * (centroid - worst),    # Expansion
+                                           centroid + 0.5 * (centroid - worst),  # Outside contraction
+                                           centroid - 0.5 * (centroid - worst)]),# Inside contraction
+                                 0, None)
+            c_r, c_e, c_oc, c_ic = self.evaluate(to_gains(candidates))
+            if c_r < cost[0]:
+                simplex[-1], cost[-1] = (candidates[1], c_e) if c_e < c_r else (candidates[0], c_r)
+            elif c_r < cost[-2]:
+                simplex[-1], cost[-1] = candidates[0], c_r
+            elif c_r < cost[-1] and c_oc <= c_r:
+                simplex[-1], cost[-1] = candidates[2], c_oc
+            elif c_ic < cost[-1]:
+                simplex[-1], cost[-1] = candidates[3], c_ic
+            else:   # Shrink towards the best point
+                simplex[1:] = simplex[0] + 0.5 * (simplex[1:] - simplex[0])
+                cost[1:] = self.evaluate(to_gains(simplex[1:]))
+        best = int(np.argmin(cost))
+        return tuple(float(g) for g in to_gains(simplex[best])[0]), float(cost[best])
+
+    def tune(self, mode:str='PID', **kwargs):
+        """Complete tuning: ultimate gain and period, Ziegler-Nichols initial gains and Nelder-Mead refinement.
+        Returns a dictionary with the gains, Ku, Tu and the final cost"""
+        ku, tu = self.find_ultimate_gain(**kwargs)
+        (kp, ki, kd), cost = self.optimize(self.ziegler_nichols(ku, tu, mode=mode), mode=mode)
+        return {'kp':kp, 'ki':ki, 'kd':kd, 'ku':ku, 'tu':tu, 'cost':cost}
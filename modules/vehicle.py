@@ -24,12 +24,46 @@ class Vehicle:
             raise ValueError("k_kgpm cannot be negative.")
         self.k_kgpm = k_kgpm
 
-    def get_drag(self):
-        """Returns quadratic drag force"""
-        return -np.sign(self.velocity) * self.k_kgpm * self.velocity **2 
+    def get_drag(self, velocity:float=None):
+        """Returns quadratic drag force at the given velocity (by default, the current vehicle's velocity)"""
+        if velocity is None:
+            velocity = self.velocity
+        return -np.sign(velocity) * self.k_kgpm * velocity **2 
+
+    def get_acceleration(self, force:float, velocity:float=None):
+        """Returns the acceleration of the vehicle given the external force, at the given velocity (by default, the current vehicle's velocity)"""
+        return (force + self.get_drag(velocity))/self.mass
         
     def update(self, force:float, dt: float):
         """Update vehicle's velocity based on the forces acting on it"""
         acceleration = (force + self.get_drag())/self.mass          # Calculates the acceleration of the vehicle given the forces acting on it.
         Vf = self.velocity + acceleration * dt                      # Calculates the velocity of the vehicle given the forces acting on it.
-        return Vf
\ No newline at end of file
+        return Vf
+
+    def get_open_loop_velocity(self, n_steps:int, dt:float, method:str='euler', decimation:int=1):
+        """Returns the velocity at the times k*dt, k=0,decimation,2*decimation..<n_steps, followed by the velocity at n_steps*dt, when no
+        force other than the drag acts on the vehicle. Only the returned samples are stored, so the memory does not grow with n_steps.
+            - 'euler': same explicit Euler recurrence as update(), with identical floating-point operations, in a tight scalar loop.
+            - 'exact': analytic solution of m*dv/dt = -k*v*|v|, i.e. v(t) = v0 / (1 + k*|v0|*t/m), evaluated in one vectorized operation."""
+        v = float(self.velocity)
+        if method == 'exact':
+            t = np.append(np.arange(0, n_steps, decimation), n_steps) * dt
+            return v / (1 + self.k_kgpm * abs(v) * t / self.mass)
+        elif method != 'euler':
+            raise ValueError("method must be 'euler' or 'exact'.")
+        n_kept = -(-n_steps // decimation)
+        velocity = np.empty(n_kept + 1)
+        k_kgpm, mass = self.k_kgpm, self.mass
+        if decimation == 1:     # Every sample is returned, without the inner loop
+            for j in range(n_steps):
+                velocity[j] = v
+                sign = 1.0 if v > 0 else (-1.0 if v < 0 else 0.0)
+                v = v + (-sign * k_kgpm * (v * v)) / mass * dt     # Same operations (and rounding) as update() with force=0
+        else:
+            for j in range(n_kept):
+                velocity[j] = v
+                for _ in range(min(decimation, n_steps - j * decimation)):     # Steps until the next returned sample
+                    sign = 1.0 if v > 0 else (-1.0 if v < 0 else 0.0)
+                    v = v + (-sign * k_kgpm * (v * v)) / mass * dt
+        velocity[n_kept] = v
+        return velocity
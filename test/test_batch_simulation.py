@@ -0,0 +1,57 @@
+'''
+Title: test_batch_simulation
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Batch_Simulation class.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.batch_simulation import Batch_Simulation
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+
+def test_initialization():
+    """Tests variables initialization and broadcasting"""
+    myBatch = Batch_Simulation(mass=1, initial_velocity=[10, 20, 30], k_kgpm=0.05, kp=0.28, ki=0.12, kd=0.05, Ts=1, target_velocity=5, dt=1, sim_time=50)
+    assert myBatch.n == 3
+    assert np.all(myBatch.mass == 1)
+    assert np.all(myBatch.initial_velocity == [10, 20, 30])
+
+    with pytest.raises(ValueError): # Negative masses are not allowed
+        Batch_Simulation(mass=[1, -1], initial_velocity=10, k_kgpm=0.05)
+    with pytest.raises(ValueError): # Negative drag constants are not allowed
+        Batch_Simulation(mass=1, initial_velocity=10, k_kgpm=[-0.05])
+    with pytest.raises(ValueError): # Invalid time step
+        Batch_Simulation(mass=1, initial_velocity=10, k_kgpm=0.05, dt=0)
+
+def test_matches_scalar_simulation():
+    """Tests that the batch results match the scalar Simulation results for every vehicle"""
+    simulations = []
+    for v0 in np.arange(start=-50, stop=50, step=5):
+        for mass, kp, ki, kd in [(1, 0.28, 0.12, 0.05), (2, 0.36, 0.206, 0), (1.5, 0, 0, 0)]:
+            controller = PID_Discrete_Controller(kp=kp, ki=ki, kd=kd, Ts=1) if kp else No_Controller()
+            simulations.append(Simulation(vehicle=Vehicle(mass=mass, initial_velocity=v0, k_kgpm=0.05), controller=controller, target_velocity=5, dt=1, sim_time=50, error_thr=1))
+    myBatch = Batch_Simulation.from_simulations(simulations)
+    with np.errstate(over='ignore', invalid='ignore'):
+        for sim in simulations:
+            sim.run()
+        myBatch.run()
+    settling_time = myBatch.get_settling_time()
+    for i, sim in enumerate(simulations):
+        assert np.allclose(myBatch.time, sim.time)
+        assert np.allclose(myBatch.velocity[i], sim.velocity, equal_nan=True)
+        assert np.allclose(myBatch.error[i], sim.error, equal_nan=True)
+        assert settling_time[i] == sim.get_settling_time()
+
+def test_from_simulations_validation():
+    """Tests that incompatible simulations cannot be batched"""
+    sim1 = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=1, sim_time=50)
+    sim2 = Simulation(vehicle=Vehicle(mass=1, initial_velocity=10, k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.5, sim_time=50)
+    with pytest.raises(ValueError):
+        Batch_Simulation.from_simulations([sim1, sim2])
@@ -0,0 +1,102 @@
+'''
+Title: test_instrumentation
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Instrumentation class.
+'''
+
+import pytest
+import pstats
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.instrumentation import Instrumentation
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+from modules.integrators import RK4_Integrator
+from modules.sweep import make_grid, run_sweep
+
+def make_simulation(controller=None, **kwargs):
+    """Simulation of the reference scenario"""
+    if controller is None:
+        controller = PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1)
+    return Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=controller, target_velocity=5, dt=1, sim_time=50, **kwargs)
+
+def test_counters():
+    """Tests the counters and timers of the step loops and the fused paths"""
+    instrumentation = Instrumentation()
+    mySim = make_simulation(instrumentation=instrumentation)
+    mySim.run()
+    assert instrumentation.counters == {'runs':1, 'steps':50, 'controller_calls':50, 'plant_evaluations':50}
+    assert instrumentation.times['controller'] > 0 and instrumentation.times['plant'] > 0
+    assert instrumentation.times['run'] >= instrumentation.times['controller'] + instrumentation.times['plant']
+
+    # Same results as without instrumentation
+    myRefSim = make_simulation()
+    myRefSim.run()
+    assert np.array_equal(mySim.velocity, myRefSim.velocity)
+
+    # Plant evaluations of the integrators
+    instrumentation.reset()
+    mySim = make_simulation(instrumentation=instrumentation, integrator=RK4_Integrator(substeps=2))
+    mySim.run()
+    assert instrumentation.counters['plant_evaluations'] == 50 * 8
+    myRefSim = make_simulation(integrator=RK4_Integrator(substeps=2))
+    myRefSim.run()
+    assert np.array_equal(mySim.velocity, myRefSim.velocity)
+
+    # Fused paths are timed as a whole
+    instrumentation.reset()
+    make_simulation(controller=No_Controller(), instrumentation=instrumentation).run()
+    assert instrumentation.last_run['controller_calls'] == 0
+    assert instrumentation.last_run['fused'] > 0
+
+    # Early stopped runs
+    instrumentation.reset()
+    make_simulation(instrumentation=instrumentation).run(hold_time=5)
+    assert 0 < instrumentation.counters['steps'] < 50
+
+    with pytest.raises(TypeError):
+        make_simulation(instrumentation='timers')
+
+def test_hooks():
+    """Tests the run and step hooks"""
+    events = []
+    instrumentation = Instrumentation(timers=False)
+    instrumentation.add_hook('run_start', lambda sim: events.append('start'))
+    instrumentation.add_hook('step', lambda sim, k, t, velocity, error, Fc: events.append(k))
+    instrumentation.add_hook('run_end', lambda sim: events.append('end'))
+    mySim = make_simulation(instrumentation=instrumentation)
+    mySim.run()
+    assert events == ['start'] + list(range(50)) + ['end']
+
+    # Hooks are also called when a stream is interrupted
+    events.clear()
+    stream = mySim.stream()
+    for t, velocity, error, Fc in stream:
+        if t == 2:
+            break
+    stream.close()
+    assert events == ['start', 0, 1, 2, 'end']
+
+    with pytest.raises(ValueError):
+        instrumentation.add_hook('sample', print)
+
+def test_profile(tmp_path):
+    """Tests the profile of a sweep and the summary report"""
+    instrumentation = Instrumentation(profile=True)
+    grid = make_grid(initial_velocity=[0, 10, 20, 30])
+    run_sweep(grid, sim_time=20, processes=2, chunksize=2, instrumentation=instrumentation)
+    assert instrumentation.counters['runs'] == 4
+    assert instrumentation.counters['steps'] == 80
+
+    path = str(tmp_path / 'sweep.prof')
+    instrumentation.dump_stats(path)
+    stats = pstats.Stats(path)
+    assert any(function == 'update' for _, _, function in stats.stats)
+    summary = instrumentation.summary(top=5)
+    assert 'controller calls: 80' in summary
+    assert 'cumulative' in summary
@@ -0,0 +1,76 @@
+'''
+Title: test_integrators
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the integrators.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.integrators import Integrator, Euler_Integrator, RK4_Integrator, RK45_Integrator
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+
+def exact_velocity(t, v0=10, k_kgpm=0.05, mass=1):
+    """Analytic solution of the vehicle without controller"""
+    return v0 / (1 + k_kgpm * abs(v0) * t / mass)
+
+def test_initialization():
+    """Tests variables initialization"""
+    assert isinstance(Euler_Integrator(), Integrator)
+    assert RK4_Integrator(substeps=4).substeps == 4
+    assert RK45_Integrator(rtol=1e-3).rtol == 1e-3
+    with pytest.raises(ValueError):
+        Euler_Integrator(substeps=0)
+    with pytest.raises(ValueError):
+        RK45_Integrator(rtol=-1)
+
+def test_euler():
+    """Tests that the Euler integrator with one substep matches Vehicle.update"""
+    myVehicle = Vehicle(mass=2,initial_velocity=5,k_kgpm=0.01)
+    integrator = Euler_Integrator()
+    assert integrator.integrate(lambda v: myVehicle.get_acceleration(1.2, v), myVehicle.velocity, 0.01) == myVehicle.update(force=1.2, dt=0.01)
+    assert integrator.n_evaluations == 1
+
+    mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+    myIntegratorSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, integrator=Euler_Integrator())
+    mySim.run()
+    myIntegratorSim.run()
+    assert np.array_equal(mySim.velocity, myIntegratorSim.velocity)
+
+def test_accuracy():
+    """Tests the convergence of the integrators against the analytic solution without controller"""
+    t = np.arange(50)
+    errors = {}
+    for integrator in [Euler_Integrator(substeps=10), RK4_Integrator(substeps=4), RK4_Integrator(substeps=8), RK45_Integrator(rtol=1e-8, atol=1e-10)]:
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=1, sim_time=50, integrator=integrator)
+        mySim.run()
+        errors[integrator] = np.max(np.abs(mySim.velocity - exact_velocity(t)))
+    euler, rk4_4, rk4_8, rk45 = errors.values()
+    assert rk4_4 < euler
+    assert 8 < rk4_4 / rk4_8 < 32     # 4th order convergence
+    assert rk45 < 1e-6
+
+def test_rk45_evaluations():
+    """Tests that the RK45 integrator reuses the last stage of an accepted step as the first stage of the next one"""
+    myVehicle = Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05)
+    calls = []
+    def f(v):
+        calls.append(v)
+        return myVehicle.get_acceleration(0, v)
+    integrator = RK45_Integrator(rtol=1e-8, atol=1e-10, h0=0.01)
+    v = integrator.integrate(f, 10.0, 1)
+    n_attempts = (len(calls) - 1) // 6                  # 6 evaluations per attempted step, plus the first stage of the call
+    assert integrator.n_evaluations == len(calls) == 1 + 6 * n_attempts
+    assert n_attempts > integrator.n_rejected
+    assert abs(v - exact_velocity(1)) < 1e-6
+
+    # The first stage is not carried over between calls, the controller output may have changed
+    calls.clear()
+    integrator.integrate(f, v, 1)
+    assert calls[0] == v and len(calls) % 6 == 1
@@ -0,0 +1,82 @@
+'''
+Title: test_metrics
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the vectorized metrics.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.metrics import compute_metrics, METRICS_DTYPE
+from modules.simulation import Simulation
+from modules.batch_simulation import Batch_Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+
+def test_settling():
+    """Tests the two-sided band check and the divergence handling"""
+    time = np.arange(6.0)
+    error = np.array([[50, 10, 0.5, 0.2, 0.1, 0.0],         # Settles at t=1
+                      [50, 10, -5, -0.5, 0.2, 0.1],         # Negative excursion, settles at t=2
+                      [50, 10, 0.5, 0.2, 0.1, -3],          # Ends outside the band
+                      [0.5, 0.2, 0.1, 0, 0, 0],             # Always inside the band
+                      [50, 80, 200, np.inf, np.nan, np.nan]])   # Diverged
+    metrics = compute_metrics(time, error, error_thr=1)
+    assert metrics.dtype == METRICS_DTYPE
+    assert metrics['settled'].tolist() == [True, True, False, True, False]
+    assert metrics['diverged'].tolist() == [False, False, False, False, True]
+    assert np.array_equal(metrics['settling_time'], [1, 2, np.nan, 0, np.nan], equal_nan=True)
+    assert metrics['overshoot'][1] == 5 and metrics['overshoot'][0] == 0
+    assert np.isinf(metrics['iae'][4]) and np.isnan(metrics['rise_time'][4])
+
+def test_integrals():
+    """Tests the integral criteria, the effort, the rise time and the steady-state error on a known response"""
+    time = np.arange(0, 10, 0.5)
+    error = 100 * np.exp(-time)
+    force = np.full_like(time, 2.0)
+    metrics = compute_metrics(time, error, force, error_thr=1, steady_state_fraction=0.1)
+    assert metrics['iae'] == pytest.approx(np.sum(error) * 0.5)
+    assert metrics['ise'] == pytest.approx(np.sum(error ** 2) * 0.5)
+    assert metrics['itae'] == pytest.approx(np.sum(time * error) * 0.5)
+    assert metrics['control_effort'] == pytest.approx(4 * 10)
+    assert metrics['peak_force'] == 2
+    assert metrics['rise_time'] == pytest.approx(2.5 - 0.5)             # First samples below 90% and 10% of the initial error
+    assert metrics['steady_state_error'] == pytest.approx(np.mean(error[-2:]))
+
+    # Without force, the effort is not available
+    assert np.isnan(compute_metrics(time, error)['control_effort'])
+    with pytest.raises(ValueError):
+        compute_metrics(time, error, steady_state_fraction=0)
+
+def test_simulations():
+    """Tests the metrics of the Simulation and the Batch_Simulation"""
+    v0 = np.array([-20.0, 0.0, 10.0, 30.0])
+    batch = Batch_Simulation(mass=1, initial_velocity=v0, k_kgpm=0.05, kp=0.28, ki=0.12, kd=0.05, Ts=1, target_velocity=5, dt=1, sim_time=50, error_thr=1).run()
+    metrics = batch.get_metrics()
+    for i, v in enumerate(v0):
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=v,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+        mySim.run()
+        assert mySim.get_metrics() == metrics[i]
+        if metrics['settled'][i] and np.all(mySim.error >= -1):         # Without negative excursions both criteria agree
+            assert metrics['settling_time'][i] == mySim.get_settling_time()
+
+    # Divergence velocity
+    metrics = batch.get_metrics(divergence_velocity=29)
+    assert metrics['diverged'].tolist() == [False, False, False, True]
+
+def test_wrapped_trace():
+    """Tests the metrics of a Simulation whose ring window starts after the settling time"""
+    myRefSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+    myRefSim.run()
+    reference = myRefSim.get_metrics()
+    for window in [20, 10]:
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, window=window)
+        mySim.run()
+        metrics = mySim.get_metrics()
+        assert metrics['settled'] and not metrics['diverged']
+        assert metrics['settling_time'] == reference['settling_time']
+        assert np.isnan(metrics['iae']) and np.isnan(metrics['overshoot'])     # Unknown from the kept window
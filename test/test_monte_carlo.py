@@ -0,0 +1,68 @@
+'''
+Title: test_monte_carlo
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Monte Carlo analysis.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.monte_carlo import Monte_Carlo, Settling_Statistics, get_settling_step
+from modules.batch_simulation import Batch_Simulation
+
+def test_settling_step():
+    """Tests the two-sided settling detection"""
+    error = np.array([[50, -5, 0.5, 0.2],       # Settles after the 2nd sample
+                      [0.5, -2, 0.5, 0.2],      # Negative excursions are detected
+                      [0.1, 0.1, 0.1, 0.1],     # Settled from the start
+                      [50, 5, 0.5, 3],          # Not settled
+                      [50, 5, np.nan, np.nan]]) # Diverged
+    assert np.array_equal(get_settling_step(error, 1), [1, 1, 0, -1, -1])
+
+def test_statistics():
+    """Tests the streaming aggregation against numpy percentiles"""
+    rng = np.random.default_rng(1)
+    steps = rng.integers(-1, 50, size=10_000)
+    statistics = Settling_Statistics(dt=0.5, sim_time=25)
+    for chunk in np.array_split(steps, 7):
+        statistics.add(chunk)
+    settled = steps[steps >= 0] * 0.5
+    assert statistics.n_runs == 10_000
+    assert statistics.n_failures == np.count_nonzero(steps < 0)
+    assert np.array_equal(statistics.percentile([50, 90]), np.percentile(settled, [50, 90], method='inverted_cdf'))
+    assert statistics.mean() == pytest.approx(settled.mean())
+
+def test_reproducibility():
+    """Tests that the results only depend on the seed, not on the number of processes"""
+    mc = Monte_Carlo(mass_std=0.1, k_kgpm_std=0.2, initial_velocity_std=10, sensor_noise_std=0.01, disturbance_std=0.1, force_limit=5, seed=3)
+    serial = mc.run(2000, batch_size=300, processes=1)
+    parallel = mc.run(2000, batch_size=300, processes=2)
+    assert serial == parallel
+    assert serial['n_scenarios'] == 2000
+    assert 0 <= serial['failure_rate'] < 1
+    assert Monte_Carlo(seed=4, initial_velocity_std=10).run(500) != Monte_Carlo(seed=5, initial_velocity_std=10).run(500)
+
+def test_nominal():
+    """Tests that without uncertainty all the scenarios behave as the nominal vehicle"""
+    result = Monte_Carlo().run(100, batch_size=30)
+    batch = Batch_Simulation(mass=1, initial_velocity=10, k_kgpm=0.05, kp=0.28, ki=0.12, kd=0.05, Ts=1, target_velocity=5, dt=1, sim_time=50).run()
+    assert result['failure_rate'] == 0
+    assert result['percentiles'][50] == result['percentiles'][99] == get_settling_step(batch.error, 1)[0]
+
+    with pytest.raises(ValueError):
+        Monte_Carlo().run(0)
+    with pytest.raises(ValueError):
+        Monte_Carlo().run(100, batch_size=0)
+    with pytest.raises(ValueError):
+        Monte_Carlo().run(100, processes=0)
+
+def test_batch_non_idealities():
+    """Tests the saturation and disturbance options of the batch simulation"""
+    batch = Batch_Simulation(mass=1, initial_velocity=10, k_kgpm=0.05, kp=0.28, ki=0.12, kd=0.05, force_limit=0.5, disturbance_force=0.2, sim_time=50).run()
+    assert np.all(np.abs(batch.force) <= 0.5)
+    with pytest.raises(ValueError):
+        Batch_Simulation(mass=1, initial_velocity=10, k_kgpm=0.05, force_limit=0)
@@ -0,0 +1,92 @@
+'''
+Title: test_pid_controller_bank
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the PID_Controller_Bank class.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.controller import PID_Controller_Bank, PID_Discrete_Controller, Controller
+from modules.batch_simulation import Batch_Simulation
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+
+def test_initialization():
+    # Bank initialization with broadcasting
+    bank = PID_Controller_Bank(kp=[1.0, 2.0, 3.0], ki=0.1, kd=0.01, Ts=0.1)
+    assert isinstance(bank, Controller)
+    assert bank.n == 3
+    assert np.all(bank.ki == 0.1)
+    assert np.all(bank.error_int == 0)
+    assert bank.error_prev is None
+
+    with pytest.raises(ValueError): # Unknown anti-windup method
+        PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, anti_windup='conditional')
+    with pytest.raises(ValueError): # Invalid saturation limits
+        PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, u_min=1, u_max=-1)
+
+def test_update():
+    # Every instance matches a PID_Discrete_Controller when Ts=1
+    gains = [(1.0, 0.1, 0.01), (0.28, 0.12, 0.05), (2.0, 0.0, 0.5)]
+    bank = PID_Controller_Bank(kp=[g[0] for g in gains], ki=[g[1] for g in gains], kd=[g[2] for g in gains], Ts=1)
+    pids = [PID_Discrete_Controller(kp=kp, ki=ki, kd=kd, Ts=1) for kp, ki, kd in gains]
+    for error in [[-5, 1, 0.5], [0.5, 2, -1], [3, 0, 0]]:
+        output = bank.update(np.array(error, dtype=float))
+        assert np.array_equal(output, [pid.update(e) for pid, e in zip(pids, error)])
+
+    # The integral is multiplied by Ts
+    bank = PID_Controller_Bank(kp=0, ki=1, kd=0, Ts=0.1)
+    assert bank.update(2.0) == pytest.approx(0.2)
+    assert isinstance(bank.update(2.0), float)     # Single controller banks work on scalars
+
+def test_saturation_anti_windup():
+    # Output saturation
+    bank = PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, u_min=-1, u_max=1)
+    assert bank.update(5.0) == 1
+
+    # Clamping: the integral does not grow while saturating
+    bank = PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, u_min=-1, u_max=1, anti_windup='clamping')
+    for _ in range(10):
+        bank.update(5.0)
+    assert bank.error_int[0] == 0
+
+    # Back-calculation: the integral is pulled back towards the saturation limit
+    bank = PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, u_min=-1, u_max=1, anti_windup='back_calculation')
+    windup = PID_Controller_Bank(kp=1, ki=1, kd=0, Ts=1, u_min=-1, u_max=1)
+    for _ in range(10):
+        bank.update(5.0)
+        windup.update(5.0)
+    assert bank.error_int[0] < windup.error_int[0]
+
+def test_derivative_filter():
+    # The filtered derivative responds smoothly to an error step
+    bank = PID_Controller_Bank(kp=0, ki=0, kd=1, Ts=1, derivative_tau=[0, 3])
+    bank.update(np.zeros(2))
+    output = bank.update(np.ones(2))
+    assert output[0] == 1
+    assert output[1] == pytest.approx(0.25)
+
+def test_simulations():
+    # Anti-windup reduces the overshoot of saturated controllers in a batch
+    clamping = PID_Controller_Bank(kp=0.28, ki=0.5, kd=0, Ts=1, u_min=-2, u_max=2, anti_windup='clamping')
+    windup = PID_Controller_Bank(kp=0.28, ki=0.5, kd=0, Ts=1, u_min=-2, u_max=2)
+    overshoot = []
+    for bank in [windup, clamping]:
+        myBatch = Batch_Simulation(mass=1, initial_velocity=0, k_kgpm=0.05, target_velocity=5, dt=1, sim_time=100, controller=bank).run()
+        overshoot.append(-myBatch.error.min())
+    assert overshoot[1] < overshoot[0]
+
+    # A single controller bank plugs into the Simulation
+    mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Controller_Bank(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+    myRefSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+    mySim.run()
+    myRefSim.run()
+    assert np.array_equal(mySim.velocity, myRefSim.velocity)
+
+    with pytest.raises(ValueError): # The bank size must match the number of vehicles
+        Batch_Simulation(mass=1, initial_velocity=[1, 2], k_kgpm=0.05, controller=PID_Controller_Bank(kp=[1, 2, 3], ki=0, kd=0, Ts=1))
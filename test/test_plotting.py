@@ -0,0 +1,50 @@
+'''
+Title: test_plotting
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the headless plotting tools.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.plotting import downsample, new_figure, make_job, render_sweep
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+
+def test_downsample():
+    """Tests that long traces are reduced while keeping their extremes"""
+    time = np.arange(100_000) * 1e-3
+    values = np.sin(time)
+    values[12345] = 10
+    t, v = downsample(time, values, max_points=1000)
+    assert len(t) <= 1000
+    assert v.max() == 10 and v.min() == values.min()
+    assert np.all(np.diff(t) > 0)
+    t, v = downsample(time[:10], values[:10], max_points=1000)    # Short traces are not modified
+    assert len(t) == 10
+
+def test_render_sweep(tmp_path):
+    """Tests that the reports of a sweep are written without a GUI, serially and in a worker pool"""
+    jobs = []
+    for v0 in [0, 10, 20]:
+        simEnv = Simulation(vehicle=Vehicle(mass=1,initial_velocity=v0,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+        simEnv.run()
+        jobs.append(make_job(simEnv, name=f'run_{v0}'))
+    paths = render_sweep(jobs, output_dir=str(tmp_path / 'serial'), formats=('png', 'svg'), processes=1)
+    assert len(paths) == 6 and all(os.path.isfile(path) for path in paths)
+    paths = render_sweep(jobs, output_dir=str(tmp_path / 'pool'), processes=2)
+    assert sorted(os.listdir(tmp_path / 'pool')) == ['run_0.png', 'run_10.png', 'run_20.png']
+
+def test_explicit_axes():
+    """Tests the Simulation plotting methods on explicit axes"""
+    simEnv = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50)
+    simEnv.run()
+    fig, (ax,) = new_figure()
+    simEnv.plot_velocity(label='Velocity profile', ax=ax)
+    simEnv.plot_velocity_sp(ax=ax)
+    assert len(ax.lines) == 2
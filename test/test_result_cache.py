@@ -0,0 +1,120 @@
+'''
+Title: test_result_cache
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Result_Cache class.
+'''
+
+import pytest
+import pickle
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.result_cache import Result_Cache, simulation_key, stable_hash
+from modules.instrumentation import Instrumentation
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+from modules.integrators import RK45_Integrator
+from modules.sweep import make_grid, run_sweep
+
+def make_simulation(mass=1, kp=0.28, **kwargs):
+    """Simulation of the reference scenario"""
+    return Simulation(vehicle=Vehicle(mass=mass,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=kp, ki=0.12, kd=0.05, Ts=1),
+                      target_velocity=5, dt=1, sim_time=50, **kwargs)
+
+def test_key():
+    """Tests the stability of the configuration hash"""
+    assert simulation_key(make_simulation(mass=1)) == simulation_key(make_simulation(mass=1.0))
+    assert simulation_key(make_simulation()) == simulation_key(make_simulation(backend='compiled'))
+    assert simulation_key(make_simulation()) != simulation_key(make_simulation(kp=0.3))
+    assert stable_hash({'a':1, 'b':np.arange(3)}) == stable_hash({'b':[0.0, 1.0, 2.0], 'a':1.0})
+
+    # Integrator counters do not change the key, the integrator step does
+    integrator = RK45_Integrator()
+    key = simulation_key(make_simulation(integrator=integrator))
+    make_simulation(integrator=integrator).run()
+    assert integrator.n_evaluations > 0 and integrator.n_rejected > 0
+    integrator.h = integrator.h0
+    assert simulation_key(make_simulation(integrator=integrator)) == key
+    integrator.h = 0.1
+    assert simulation_key(make_simulation(integrator=integrator)) != key
+
+def test_run(tmp_path):
+    """Tests that cache hits skip the simulation and restore its results"""
+    cache = Result_Cache(str(tmp_path / 'cache.sqlite'))
+    mySim = make_simulation()
+    settling_time = cache.run(mySim, traces=True)
+    assert settling_time == mySim.get_settling_time()
+    assert cache.misses == 1 and len(cache) == 1
+
+    instrumentation = Instrumentation()
+    myCachedSim = make_simulation(instrumentation=instrumentation)
+    assert cache.run(myCachedSim, traces=True) == settling_time
+    assert instrumentation.counters['runs'] == 0        # Not simulated
+    assert cache.hits == 1
+    assert np.array_equal(myCachedSim.velocity, mySim.velocity)
+    assert np.array_equal(myCachedSim.force, mySim.force)
+    assert myCachedSim.vehicle.velocity == mySim.vehicle.velocity
+
+    # Results stored without traces are a miss when traces are requested
+    cache.run(make_simulation(kp=0.3))
+    cache.run(make_simulation(kp=0.3), traces=True)
+    assert cache.misses == 3
+    cache.close()
+
+def test_window(tmp_path):
+    """Tests that the restored trace keeps the settling state of the samples dropped by the ring window"""
+    cache = Result_Cache(str(tmp_path / 'cache.sqlite'))
+    reference = make_simulation()
+    reference.run()
+    mySim = make_simulation(window=10)
+    assert cache.run(mySim, traces=True) == reference.get_settling_time()
+    myCachedSim = make_simulation(window=10)
+    assert cache.run(myCachedSim, traces=True) == reference.get_settling_time()
+    assert myCachedSim.trace.is_wrapped()
+    assert np.array_equal(myCachedSim.time, mySim.time) and np.array_equal(myCachedSim.error, mySim.error)
+    assert myCachedSim.get_settling_time() == reference.get_settling_time()
+    assert myCachedSim.get_metrics()['settling_time'] == reference.get_metrics()['settling_time']
+
+def test_diverged(tmp_path):
+    """Tests the round trip of a diverged run, whose final velocity is not finite"""
+    cache = Result_Cache(str(tmp_path / 'cache.sqlite'))
+    for _ in range(2):
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=-50,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1),
+                           target_velocity=5, dt=1, sim_time=50)
+        with np.errstate(over='ignore', invalid='ignore'):
+            settling_time = cache.run(mySim, traces=True)
+        assert type(settling_time) is float and settling_time == -1
+        assert isinstance(mySim.vehicle.velocity, float) and np.isnan(mySim.vehicle.velocity)
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_eviction(tmp_path):
+    """Tests the size bound and the least recently used eviction"""
+    entry_size = 64 + 8 * (6 + 4 * 50)                  # Trace state and traces
+    cache = Result_Cache(str(tmp_path / 'cache.sqlite'), max_bytes=3 * entry_size)
+    keys = []
+    for kp in [0.1, 0.2, 0.3]:
+        mySim = make_simulation(kp=kp)
+        keys.append(simulation_key(mySim))
+        cache.run(mySim, traces=True)
+    assert cache.size() == 3 * entry_size
+    cache.get(keys[0])                                  # The oldest result is used again
+    cache.run(make_simulation(kp=0.4), traces=True)
+    assert len(cache) == 3 and cache.size() <= cache.max_bytes
+    assert cache.get(keys[1]) is None                   # The least recently used result was evicted
+    assert cache.get(keys[0]) is not None
+
+def test_sweep(tmp_path):
+    """Tests the cache shared by the workers of a sweep"""
+    cache = Result_Cache(str(tmp_path / 'cache.sqlite'))
+    cache = pickle.loads(pickle.dumps(cache))
+    grid = make_grid(initial_velocity=[-20, 0, 10, 20], kp=[0.2, 0.28])
+    results = run_sweep(grid, sim_time=50, processes=2, chunksize=2, cache=cache)
+    assert len(cache) == len(grid)
+    cached = run_sweep(grid, sim_time=50, processes=1, cache=cache)
+    assert cache.hits == len(grid)
+    assert np.array_equal(cached['settling_time'], results['settling_time'])
+    assert np.array_equal(results['settling_time'], run_sweep(grid, sim_time=50, processes=1)['settling_time'])
@@ -0,0 +1,84 @@
+'''
+Title: test_scenarios
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the declarative scenario runner.
+'''
+
+import pytest
+import json
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.scenarios import load_config, expand_scenarios, config_hash, run_config, main
+from modules.sweep import make_grid, run_sweep
+
+CONFIG = {'defaults':{'sim_time':30, 'kp':0.28},
+          'scenarios':[{'name':'nominal'}, {'name':'open_loop', 'controller':'none'}],
+          'sweeps':[{'name':'v0', 'parameters':{'mass':2}, 'grid':{'initial_velocity':{'start':0, 'stop':30, 'step':10}, 'kp':[0.2, 0.4]}}]}
+
+def test_expand_scenarios():
+    """Tests the expansion of the scenarios and sweeps and the config hash"""
+    scenarios = expand_scenarios(CONFIG)
+    assert [s['name'] for s in scenarios][:3] == ['nominal', 'open_loop', 'v0_0000']
+    assert len(scenarios) == 2 + 3 * 2
+    assert scenarios[0]['sim_time'] == 30 and scenarios[0]['mass'] == 1
+    assert scenarios[-1]['mass'] == 2 and scenarios[-1]['initial_velocity'] == 20 and scenarios[-1]['kp'] == 0.4
+
+    # The hash depends on the parameters only
+    assert config_hash(scenarios[0]) == config_hash({**scenarios[0], 'name':'other', 'mass':1.0})
+    assert config_hash(scenarios[0]) != config_hash({**scenarios[0], 'mass':1.5})
+    assert config_hash(scenarios[0]) == config_hash({**scenarios[0], 'backend':'compiled', 'substeps':4})   # No effect on the results
+    assert config_hash(scenarios[1]) == config_hash({**scenarios[1], 'kp':1.0, 'Ts':0.5})                  # Gains without controller
+    assert config_hash(scenarios[0]) != config_hash({**scenarios[0], 'integrator':'rk4', 'substeps':4})
+    assert config_hash({**scenarios[0], 'integrator':'rk4'}) != config_hash({**scenarios[0], 'integrator':'rk4', 'substeps':4})
+
+    with pytest.raises(ValueError):
+        expand_scenarios({'scenarios':[{'name':'typo', 'mas':1}]})
+    with pytest.raises(ValueError):
+        expand_scenarios({'scenarios':[{'controller':'LQR'}]})
+
+def test_load_config(tmp_path):
+    """Tests the JSON and TOML readers"""
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(CONFIG))
+    assert load_config(str(path)) == CONFIG
+    path = tmp_path / 'config.toml'
+    path.write_text('[defaults]\nsim_time = 30\n\n[[scenarios]]\nname = "nominal"\nmass = 2\n')
+    assert expand_scenarios(load_config(str(path)))[0]['mass'] == 2
+    with pytest.raises(ValueError):
+        load_config(str(tmp_path / 'config.ini'))
+
+def test_run_config(tmp_path):
+    """Tests the results, the incremental reruns and the CLI"""
+    output_dir = str(tmp_path / 'output')
+    scenarios = run_config(CONFIG, output_dir=output_dir, processes=2)
+    assert os.path.exists(os.path.join(output_dir, 'summary.csv'))
+    assert scenarios[1]['settling_time'] == -1     # No controller
+
+    # Same settling times as the sweep
+    grid = make_grid(initial_velocity=[0, 10, 20], kp=[0.2, 0.4], mass=2)
+    results = run_sweep(grid, sim_time=30, processes=1)
+    assert sorted(s['settling_time'] for s in scenarios[2:]) == sorted(results['settling_time'])
+
+    # Traces
+    traces = np.load(os.path.join(output_dir, 'runs', scenarios[0]['hash'] + '.npz'))
+    assert len(traces['velocity']) == 30
+
+    # Reruns only simulate the new scenarios
+    runs = os.path.join(output_dir, 'runs')
+    mtimes = {f:os.path.getmtime(os.path.join(runs, f)) for f in os.listdir(runs)}
+    config = {**CONFIG, 'scenarios':CONFIG['scenarios'] + [{'name':'heavy', 'mass':3}]}
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config))
+    main([str(path), '--output', output_dir, '--backend', 'compiled'])      # The backend does not force a rerun
+    assert len(os.listdir(runs)) == len(mtimes) + 2
+    assert all(os.path.getmtime(os.path.join(runs, f)) == mtime for f, mtime in mtimes.items())
+
+    # The compiled backend is only applied to the scenarios it supports
+    config = {'scenarios':[{'name':'a'}, {'name':'b', 'integrator':'rk4', 'substeps':4}]}
+    scenarios = run_config(config, output_dir=str(tmp_path / 'mixed'), backend='compiled')
+    assert [s['backend'] for s in scenarios] == ['compiled', 'python']
+    assert os.path.exists(tmp_path / 'mixed' / 'summary.csv')
@@ -7,6 +7,7 @@ Description: This file contains the unit test for the Simulation class.
 '''
 
 import pytest
+import numpy as np
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -23,3 +24,148 @@ def test_initialization():
     assert mySim.dt == 1                    # Simulation time step [s]
     assert mySim.sim_time == 100        # Simulation duration [s]
     assert mySim.error_thr == 1      # Error threshold [%]
+
+def test_run():
+    """Tests the trace buffer filled by the simulation and the settling time"""
+    mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=0.1), target_velocity=5, dt=0.1, sim_time=1, error_thr=1)
+    mySim.run()
+    assert len(mySim.time) == 10                # Step count does not drift with float error
+    assert mySim.time[-1] == 9 * 0.1
+    assert mySim.velocity[0] == 10
+    assert mySim.error[0] == -100
+    assert mySim.force[0] == -5 * 0.28 - 5 * 0.12
+
+    mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1)
+    mySim.run()
+    settling_time = mySim.get_settling_time()
+    assert 0 < settling_time < 30
+
+    # The settling time is preserved when only the last seconds of the run are kept
+    mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1, window=40)
+    mySim.run()
+    assert len(mySim.time) == 40
+    assert mySim.get_settling_time() == settling_time
+
+    # The settling time is tracked over the whole run, also when the window starts after it
+    for window in [20, 10]:
+        for backend in ['python', 'compiled']:
+            mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1, window=window, backend=backend)
+            mySim.run()
+            assert mySim.time[0] > settling_time
+            assert mySim.get_settling_time() == settling_time
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1, window=window)
+        mySim.run(hold_time=100)
+        assert mySim.get_settling_time() == settling_time
+
+def test_open_loop():
+    """Tests the fast path used without controller"""
+    for v0 in [-40, -7.3, 0, 10, 55.5]:
+        mySim = Simulation(vehicle=Vehicle(mass=1.3,initial_velocity=v0,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.1, sim_time=50, open_loop=None)
+        myFastSim = Simulation(vehicle=Vehicle(mass=1.3,initial_velocity=v0,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.1, sim_time=50, open_loop='euler')
+        mySim.run()
+        myFastSim.run()
+        # The 'euler' fast path reproduces the step loop exactly
+        assert np.array_equal(mySim.time, myFastSim.time)
+        assert np.array_equal(mySim.velocity, myFastSim.velocity)
+        assert np.array_equal(mySim.error, myFastSim.error)
+        assert mySim.vehicle.velocity == myFastSim.vehicle.velocity
+
+    # The 'exact' fast path is the limit of the step loop for small time steps
+    myExactSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=1, sim_time=50, open_loop='exact')
+    myFineSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.001, sim_time=50, decimation=1000)
+    myExactSim.run()
+    myFineSim.run()
+    assert np.allclose(myExactSim.velocity, myFineSim.velocity, rtol=1e-3)
+
+    # Runs longer than a block, with decimation and a ring window
+    for decimation, window in [(1, None), (3, None), (7, 20)]:
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=-30,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.01, sim_time=300, decimation=decimation, window=window, open_loop=None)
+        myFastSim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=-30,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=0.01, sim_time=300, decimation=decimation, window=window)
+        mySim.run()
+        myFastSim.run()
+        for field in ['time', 'velocity', 'error', 'force']:
+            assert np.array_equal(getattr(mySim, field), getattr(myFastSim, field))
+        assert mySim.vehicle.velocity == myFastSim.vehicle.velocity
+        assert [getattr(mySim.trace, name) for name in mySim.trace.TRACKED] == [getattr(myFastSim.trace, name) for name in myFastSim.trace.TRACKED]
+
+    with pytest.raises(ValueError):
+        Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, open_loop='rk4')
+
+def test_open_loop_memory():
+    """Tests that the open-loop fast path only allocates memory for the kept samples"""
+    import tracemalloc
+    for open_loop in ['euler', 'exact']:
+        mySim = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, dt=1e-3, sim_time=500, decimation=1000, open_loop=open_loop)
+        tracemalloc.start()
+        mySim.run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert len(mySim.time) == 500
+        assert peak < 1e6           # The 5e5 steps would need 16 MB per trace row
+
+def test_stream():
+    """Tests the streaming interface and the early stop"""
+    def make_sim(v0=10):
+        return Simulation(vehicle=Vehicle(mass=1,initial_velocity=v0,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1)
+    mySim = make_sim()
+    mySim.run()
+
+    # Step by step and chunked streams reproduce the full run
+    samples = list(make_sim().stream())
+    assert len(samples) == 50
+    assert np.array_equal([s[1] for s in samples], mySim.velocity)
+    chunks = list(make_sim().stream(chunk_size=16))
+    assert [len(c[0]) for c in chunks] == [16, 16, 16, 2]
+    assert np.array_equal(np.concatenate([c[2] for c in chunks]), mySim.error)
+
+    # Early stop once the error has stayed in the band for the hold window
+    myStreamSim = make_sim()
+    myStreamSim.run(hold_time=5)
+    assert myStreamSim.stop_reason == 'settled'
+    assert len(myStreamSim.time) < 50
+    assert np.array_equal(myStreamSim.velocity, mySim.velocity[:len(myStreamSim.time)])
+    assert np.all(np.abs(myStreamSim.error[-5:]) <= 1) and abs(myStreamSim.error[-6]) > 1
+    with pytest.raises(ValueError):     # Early stopping is not supported by the compiled backend
+        Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, backend='compiled').run(hold_time=5)
+
+    # Early stop on divergence
+    myDivergingSim = make_sim(v0=-50)
+    with np.errstate(over='ignore', invalid='ignore'):
+        samples = list(myDivergingSim.stream(divergence_velocity=1000))
+    assert myDivergingSim.stop_reason == 'diverged'
+    assert abs(samples[-1][1]) > 1000
+
+def test_compiled_backend():
+    """Tests that the compiled backend is bit-for-bit identical to the python backend"""
+    for v0, controller_args, decimation, window in [(10, (0.28, 0.12, 0.05), 1, None), (-50, (0.36, 0.206, 0), 1, None), (33.3, (1.2, 0.5, 0.3), 3, 7), (7, None, 1, None)]:
+        results = []
+        for backend in ['python', 'compiled']:
+            controller = PID_Discrete_Controller(*controller_args, Ts=0.1) if controller_args else No_Controller()
+            mySim = Simulation(vehicle=Vehicle(mass=1.5,initial_velocity=v0,k_kgpm=0.05), controller=controller, target_velocity=5, dt=0.1, sim_time=20,
+                               decimation=decimation, window=window, open_loop=None, backend=backend)
+            with np.errstate(over='ignore', invalid='ignore'):
+                mySim.run()
+            results.append(mySim)
+        python, compiled = results
+        for field in ['time', 'velocity', 'error', 'force']:
+            assert np.array_equal(getattr(python, field), getattr(compiled, field), equal_nan=True)
+        assert np.array_equal(python.vehicle.velocity, compiled.vehicle.velocity, equal_nan=True)
+        assert [getattr(python.trace, name) for name in python.trace.TRACKED] == [getattr(compiled.trace, name) for name in compiled.trace.TRACKED]
+        if controller_args:
+            assert np.array_equal(python.controller.error_int, compiled.controller.error_int, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=No_Controller(), target_velocity=5, backend='fortran')
+
+def test_lazy_imports():
+    """Tests that the simulation core runs without importing matplotlib or Numba"""
+    import subprocess
+    code = ('import sys\n'
+            'from modules.simulation import Simulation\n'
+            'from modules.vehicle import Vehicle\n'
+            'from modules.controller import PID_Discrete_Controller\n'
+            'Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5).run()\n'
+            'print("matplotlib" in sys.modules, "numba" in sys.modules)')
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['False', 'False']
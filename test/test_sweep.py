@@ -0,0 +1,38 @@
+'''
+Title: test_sweep
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the parameter sweep runner.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.sweep import make_grid, run_sweep, SWEEP_FIELDS
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller
+
+def test_make_grid():
+    """Tests the cartesian product of the sweep axes"""
+    grid = make_grid(initial_velocity=np.arange(-50, 50, 5), kp=[0.28, 0.36])
+    assert len(grid) == 40
+    assert set(grid.dtype.names) == set(SWEEP_FIELDS)
+    assert np.all(grid['mass'] == 1)
+    with pytest.raises(ValueError):
+        make_grid(velocity=[1, 2])
+
+def test_run_sweep():
+    """Tests that the serial and parallel paths match the robustness analysis done with individual simulations"""
+    grid = make_grid(initial_velocity=np.arange(-50, 50, 5), mass=[1, 2])
+    serial = run_sweep(grid, sim_time=50, processes=1)
+    parallel = run_sweep(grid, sim_time=50, processes=2, chunksize=7)
+    assert np.array_equal(serial, parallel)
+    for point in serial[:5]:
+        simEnv = Simulation(vehicle=Vehicle(mass=point['mass'], initial_velocity=point['initial_velocity'], k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, error_thr=1)
+        with np.errstate(over='ignore', invalid='ignore'):
+            simEnv.run()
+        assert point['settling_time'] == simEnv.get_settling_time()
@@ -0,0 +1,101 @@
+'''
+Title: test_trace
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Trace_Buffer class.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.trace import Trace_Buffer, get_n_steps
+
+def test_n_steps():
+    """Tests that the number of steps does not drift with float error"""
+    assert get_n_steps(sim_time=50, dt=1) == 50
+    assert get_n_steps(sim_time=1, dt=0.1) == 10
+    assert get_n_steps(sim_time=1.05, dt=0.1) == 11
+
+def test_initialization():
+    """Tests the buffer sizing"""
+    assert Trace_Buffer(n_steps=100).capacity == 100
+    assert Trace_Buffer(n_steps=100, decimation=3).capacity == 34
+    assert Trace_Buffer(n_steps=100, dt=0.1, window=2).capacity == 20
+    with pytest.raises(ValueError):
+        Trace_Buffer(n_steps=100, decimation=0)
+    with pytest.raises(ValueError):
+        Trace_Buffer(n_steps=100, window=-1)
+
+def test_append():
+    """Tests full, decimated and ring storage"""
+    buffer = Trace_Buffer(n_steps=10)
+    for k in range(10):
+        buffer.append(k, 2*k, 3*k, 4*k)
+    assert np.all(buffer.get('time') == np.arange(10))
+    assert np.all(buffer.get('force') == 4*np.arange(10))
+    assert np.shares_memory(buffer.get('error'), buffer._data)    # No copies while the ring has not wrapped
+
+    buffer = Trace_Buffer(n_steps=10, decimation=3)
+    for k in range(10):
+        buffer.append(k, k, k, k)
+    assert np.all(buffer.get('time') == [0, 3, 6, 9])
+
+    buffer = Trace_Buffer(n_steps=10, dt=1, window=4)
+    for k in range(10):
+        buffer.append(k, k, k, k)
+    assert np.all(buffer.get('time') == [6, 7, 8, 9])
+    assert buffer.last('velocity') == 9
+    assert buffer.sample('velocity', 0) == 6
+
+def test_extend():
+    """Tests that block writes match sample by sample writes"""
+    for decimation, window in [(1, None), (2, None), (1, 7), (3, 5)]:
+        buffer1 = Trace_Buffer(n_steps=50, decimation=decimation, window=window)
+        buffer2 = Trace_Buffer(n_steps=50, decimation=decimation, window=window)
+        for k in range(50):
+            buffer1.append(k, -k, k, 0)
+        buffer2.extend(np.arange(20), -np.arange(20), np.arange(20), 0)
+        buffer2.extend(np.arange(20, 50), -np.arange(20, 50), np.arange(20, 50), 0)
+        for field in Trace_Buffer.FIELDS:
+            assert np.all(buffer1.get(field) == buffer2.get(field))
+        # Blocks already decimated
+        buffer3 = Trace_Buffer(n_steps=50, decimation=decimation, window=window)
+        for start, stop in [(0, 6 * decimation), (6 * decimation, 50)]:
+            k = np.arange(start, stop, decimation)
+            buffer3.extend(k, -k, k, 0, offered=stop - start)
+        for field in Trace_Buffer.FIELDS:
+            assert np.all(buffer1.get(field) == buffer3.get(field))
+    with pytest.raises(ValueError):
+        Trace_Buffer(n_steps=50, decimation=3).extend(np.arange(3), 0, 0, 0, offered=3)
+
+def test_last_index_above():
+    """Tests the in-place search used by the settling time"""
+    buffer = Trace_Buffer(n_steps=10, window=4)
+    for k, e in enumerate([5, 5, 5, 5, 5, 5, 5, 2, 0, 0]):
+        buffer.append(k, 0, e, 0)
+    assert buffer.last_index_above('error', 1) == 1
+    assert buffer.sample('time', buffer.last_index_above('error', 1)) == 7
+    assert buffer.last_index_above('error', 10) == -1
+
+def test_tracking():
+    """Tests the settling and divergence state tracked over the samples dropped by the ring"""
+    errors = [5, -5, 5, 0.5, -3, 0.5, 0, 0, 0, 0]
+    buffer1 = Trace_Buffer(n_steps=10, window=3, error_thr=1)
+    buffer2 = Trace_Buffer(n_steps=10, window=3, error_thr=1)
+    for k, e in enumerate(errors):
+        buffer1.append(k, -k, e, 0)
+    buffer2.extend(np.arange(4), -np.arange(4), errors[:4], 0)
+    buffer2.extend(np.arange(4, 10), -np.arange(4, 10), errors[4:], 0)
+    for buffer in [buffer1, buffer2]:
+        assert buffer.is_wrapped()
+        assert buffer.first_time == 0
+        assert buffer.last_above == 2           # One-sided
+        assert buffer.last_outside == 4         # Two-sided
+        assert buffer.max_abs_velocity == 9 and not buffer.non_finite
+
+    buffer = Trace_Buffer(n_steps=10, window=3, error_thr=1)
+    buffer.append(0, np.inf, np.nan, 0)
+    assert buffer.non_finite and buffer.last_outside == 0
@@ -0,0 +1,69 @@
+'''
+Title: test_trace_store
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the Trace_Writer and Trace_Store classes.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.trace_store import Trace_Writer, Trace_Store
+from modules.sweep import make_grid, run_sweep
+from modules.simulation import Simulation
+from modules.vehicle import Vehicle
+from modules.controller import PID_Discrete_Controller, No_Controller
+
+def test_write_read(tmp_path):
+    """Tests that the runs are read back through memory-mapping"""
+    path = str(tmp_path / 'store')
+    simulations = [Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50),
+                   Simulation(vehicle=Vehicle(mass=2,initial_velocity=-5,k_kgpm=0.1), controller=No_Controller(), target_velocity=5, dt=0.5, sim_time=20)]
+    with Trace_Writer(path) as writer:
+        for simEnv in simulations:
+            simEnv.run()
+            writer.append(simEnv)
+    store = Trace_Store(path)
+    assert len(store) == 2
+    assert isinstance(store.column('velocity'), np.memmap)
+    for i, simEnv in enumerate(simulations):
+        run = store.get_run(i)
+        for column in ['time', 'velocity', 'error', 'force']:
+            assert np.array_equal(run[column], getattr(simEnv, column))
+        assert run['mass'] == simEnv.vehicle.mass
+        assert run['settling_time'] == simEnv.get_settling_time()
+    assert store.get_run(0)['kp'] == 0.28
+    assert np.isnan(store.get_run(1)['kp'])
+    assert [store.get_run(i)['initial_velocity'] for i in range(2)] == [10, -5]
+
+    # The initial velocity is the one at the start of the run, also when the ring window dropped it
+    window_path = str(tmp_path / 'window_store')
+    simEnv = Simulation(vehicle=Vehicle(mass=1,initial_velocity=10,k_kgpm=0.05), controller=PID_Discrete_Controller(kp=0.28, ki=0.12, kd=0.05, Ts=1), target_velocity=5, dt=1, sim_time=50, window=10)
+    simEnv.run()
+    with Trace_Writer(window_path) as writer:
+        writer.append(simEnv)
+    assert simEnv.velocity[0] != 10
+    assert Trace_Store(window_path).get_run(0)['initial_velocity'] == 10
+
+    # Appending to an existing store
+    with Trace_Writer(path) as writer:
+        writer.append_arrays(time=[0, 1], velocity=[3, 4], error=0, force=0, mass=3)
+    store = Trace_Store(path)
+    assert len(store) == 3
+    assert np.array_equal(store.get(2, 'velocity'), [3, 4])
+    with pytest.raises(ValueError):
+        Trace_Writer(path).append_arrays(time=[0], velocity=[0], error=[0], force=[0], color=1)
+
+def test_sweep_store(tmp_path):
+    """Tests that the sweep streams its traces to the store"""
+    path = str(tmp_path / 'sweep')
+    grid = make_grid(initial_velocity=[-10, 0, 10, 20], kp=[0.28, 0.36])
+    results = run_sweep(grid, sim_time=50, processes=2, chunksize=3, trace_store=path)
+    store = Trace_Store(path)
+    assert len(store) == len(grid)
+    assert np.array_equal(store.runs['initial_velocity'], grid['initial_velocity'])
+    assert np.array_equal(store.runs['settling_time'], results['settling_time'])
+    assert np.all(store.runs['length'] == 50)
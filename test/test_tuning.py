@@ -0,0 +1,39 @@
+'''
+Title: test_tuning
+Author: Tomas Liendro
+Scope: Vehicle Control Problem
+
+Description: This file contains the unit test for the PID_Tuner class.
+'''
+
+import pytest
+import numpy as np
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.tuning import PID_Tuner
+
+def test_ultimate_gain():
+    """Tests Ku and Tu against the linearized discrete loop: (Ku + 2*k*v) * Ts / m = 2 with a two-sample oscillation"""
+    tuner = PID_Tuner(mass=1, initial_velocity=10, k_kgpm=0.05, target_velocity=5)
+    ku, tu = tuner.find_ultimate_gain()
+    assert 1.4 < ku < 1.7
+    assert tu == 2
+
+def test_cache():
+    """Tests that previously evaluated gains are not simulated again"""
+    tuner = PID_Tuner(mass=1, initial_velocity=10, k_kgpm=0.05, target_velocity=5)
+    cost = tuner.evaluate([[0.28, 0.12, 0.05], [0.36, 0.206, 0]])
+    assert tuner.n_evaluations == 2
+    assert np.array_equal(tuner.evaluate([[0.36, 0.206, 0], [0.28, 0.12, 0.05]]), cost[::-1])
+    assert tuner.n_evaluations == 2
+    assert tuner.evaluate([[5, 5, 5]])[0] == np.inf      # Diverging gains
+
+def test_tune():
+    """Tests that the tuned gains improve the manually selected ones"""
+    tuner = PID_Tuner(mass=1, initial_velocity=10, k_kgpm=0.05, target_velocity=5)
+    result = tuner.tune(mode='PI')
+    assert result['kd'] == 0
+    assert result['cost'] < tuner.evaluate([[0.28, 0.12, 0.05]])[0]
+    with pytest.raises(ValueError):
+        tuner.ziegler_nichols(1, 1, mode='PD')